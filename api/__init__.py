@@ -1 +1,4 @@
-from .kwork import KworkAPI
\ No newline at end of file
+from .models import Project, ProjectFile
+from .kwork import KworkAPI, FeedState
+from .pool import HttpPool
+from .sessions import KworkSessionManager
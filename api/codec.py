@@ -0,0 +1,37 @@
+"""JSON decoding of Kwork responses.
+
+orjson or msgspec is used when installed, the standard library otherwise.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+    DecodeError = orjson.JSONDecodeError
+
+    def loads(data: bytes | str) -> Any:
+        return orjson.loads(data)
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    DecodeError = msgspec.DecodeError
+    _decoder = msgspec.json.Decoder()
+
+    def loads(data: bytes | str) -> Any:
+        return _decoder.decode(data)
+else:
+    BACKEND = "json"
+    DecodeError = ValueError
+
+    def loads(data: bytes | str) -> Any:
+        return json.loads(data)
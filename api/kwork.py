@@ -1,63 +1,118 @@
+import hashlib
 import logging
-import traceback
-from typing import Dict, Any, Tuple, Optional
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Set, Tuple, Optional
 
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientResponse, CookieJar
 from http.cookies import SimpleCookie
+from yarl import URL
 
 from db import User
-from cryptographer import encrypt
+from cryptographer import encrypt_async, invalidate_cookie
+from metrics import registry
+from offload import offloader
+from . import codec
+from .models import Project
+from .pool import HttpPool, KWORK_URL
 
 
-async def auth(login: str, password: str, user_id: int, db_session: AsyncSession) -> Tuple[bool, Optional[str]]:
+KWORK_SECONDS = registry.histogram("kwork_request_seconds", "Duration of Kwork API calls", ("method",))
+
+
+async def auth(login: str, password: str, user_id: int, db_session: AsyncSession, http_pool: HttpPool) -> Tuple[bool, Optional[str]]:
     try:
         logging.info(f"Starting auth process for user_id: {user_id}")
-        async with ClientSession() as session:
-            kwork = KworkAPI(session)
-            logging.info("Attempting Kwork login")
-            success, _, response_data = await kwork.login(login, password)
-            
-            if not success:
-                error_message = response_data.get('error') if response_data else "Неизвестная ошибка"
-                logging.error(f"Kwork login failed: {error_message}")
-                return False, error_message
-            
-            logging.info("Kwork login successful, updating database")
-            user = await db_session.scalar(
-                select(User)
-                .options(selectinload(User.kwork_session))
-                .where(User.id == user_id)
-            )
-            user.kwork_session.login = encrypt(login)
-            user.kwork_session.password = encrypt(password)
-            await db_session.commit()
-            
-            return True, None
+        kwork = http_pool.kwork()
+        logging.info("Attempting Kwork login")
+        success, cookies, response_data = await kwork.login(login, password)
+        
+        if not success:
+            error_message = response_data.get('error') if response_data else "Неизвестная ошибка"
+            logging.error(f"Kwork login failed: {error_message}")
+            return False, error_message
+        
+        logging.info("Kwork login successful, updating database")
+        user = await db_session.scalar(
+            select(User)
+            .options(selectinload(User.kwork_session))
+            .where(User.id == user_id)
+        )
+        user.kwork_session.login = await encrypt_async(login)
+        user.kwork_session.password = await encrypt_async(password)
+        user.kwork_session.cookie = await encrypt_async(cookie_string(cookies))
+        await db_session.commit()
+        invalidate_cookie(user_id)
+        http_pool.forget(user_id)
         
+        return True, None
+    
     except Exception as e:
-        logging.error(f"Auth error: {str(e)}\n{traceback.format_exc()}")
+        logging.error(f"Auth error: {e}", exc_info=True)
         await db_session.rollback()
         return False, "Неизвестная ошибка"
 
 
+def cookie_string(cookies: SimpleCookie) -> str:
+    return '; '.join(f"{key}={morsel.value}" for key, morsel in cookies.items())
+
+
+def decode_projects(raw: bytes) -> Tuple[Optional[List[Project]], Optional[str]]:
+    """Decode a projects page, runs in the offload pool for large pages.
+
+    Args:
+        raw (bytes): Response body.
+
+    Returns:
+        Tuple[List[Project] | None, str | None]: Projects, error if the page isn't a projects list.
+    """
+    try:
+        response_data = codec.loads(raw)
+    except codec.DecodeError:
+        return None, "response is not JSON"
+    
+    if not response_data["success"]:
+        return None, f"error {response_data.get('error')}"
+    
+    projects = []
+    for data in response_data["data"]["pagination"]["data"]:
+        try:
+            projects.append(Project.from_dict(data))
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Skipping malformed project {data.get('id') if isinstance(data, dict) else data!r}: {e}")
+    return projects, None
+
+
+@dataclass
+class FeedState:
+    """Incremental fetch state of one projects feed."""
+    known_ids: Set[int] = field(default_factory=set)
+    body_hash: Optional[bytes] = None
+    first_page_ids: List[int] = field(default_factory=list)
+    changed: bool = True
+    max_pages: int = 3
+
+
 class KworkAPI(object):
     
-    def __init__(self, session: ClientSession) -> None:
+    def __init__(self, session: ClientSession, cookie_jar: Optional[CookieJar] = None) -> None:
         self.session = session
+        self.cookie_jar = cookie_jar
+        self.session_expired = False
         self.headers = {
             "Accept": "application/json, text/plain, */*",
             "Accept-Encoding": "gzip, deflate, br, zstd",
             "Accept-Language": "ru,en;q=0.9,en-GB;q=0.8,en-US;q=0.7",
             "Connection": "keep-alive",
             "Content-Type": "application/json",
-            "Host": "kwork.ru",
-            "Origin": "https://kwork.ru",
+            "Host": KWORK_URL.raw_host if KWORK_URL.is_default_port() else f"{KWORK_URL.raw_host}:{KWORK_URL.port}",
+            "Origin": str(KWORK_URL.origin()),
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36 Edg/131.0.0.0"
         }
         
+    @KWORK_SECONDS.labels("login").timed
     async def login(self, username: str, password: str) -> Tuple[bool, Optional[SimpleCookie], Optional[Dict[str, Any]]]:
         """Login to Kwork.
 
@@ -68,7 +123,7 @@ class KworkAPI(object):
         Returns:
             Tuple[bool, SimpleCookie, Dict[str, Any] | None]: Success, cookie, login response.
         """
-        url = "https://kwork.ru/api/user/login"
+        url = str(KWORK_URL / "api/user/login")
         body = {
             "l_username": username,
             "l_password": password,
@@ -79,9 +134,10 @@ class KworkAPI(object):
             "l_remember_me": "1"
         }
         
-        async with self.session.post(url, headers=self.headers, json=body) as response:
+        async with self.session.post(url, headers=self.request_headers(url), json=body) as response:
+            self.store_cookies(response)
             if response.status == 200:
-                response_data = await response.json()
+                response_data = codec.loads(await response.read())
                 if response_data["success"]:
                     return True, response.cookies, response_data
                 else:
@@ -91,29 +147,104 @@ class KworkAPI(object):
                 logging.error(f"Login failed with status code: {response.status}")
                 return False, None, None
 
-    async def get_projects(self) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    @KWORK_SECONDS.labels("get_projects").timed
+    async def get_projects(self, state: Optional["FeedState"] = None) -> Tuple[bool, Optional[List[Project]]]:
         """Get projects.
+        
+        Without a state the first page is returned. With a state the fetch is incremental:
+        if the first page body is byte-identical to the previous one nothing is parsed and an
+        empty list is returned, otherwise only projects that weren't on the pages fetched last
+        time are returned and further pages are requested only while a page has none of them.
+        Ids aren't compared by value: a project published late with a lower id is still new.
+
+        Args:
+            state (Optional[FeedState]): Incremental fetch state of the feed, updated in place.
 
         Returns:
-            Tuple[Dict[str, Any] | None, bool]: Projects, success.
+            Tuple[bool, List[Project] | None]: Success, projects.
         """
-        url = "https://kwork.ru/projects?a=1&page=1"
+        self.session_expired = False
+        raw = await self._get_projects_page(1)
+        if raw is None:
+            return False, None
+        
+        digest = hashlib.blake2b(raw, digest_size=16).digest()
+        if state is not None and state.body_hash == digest:
+            state.changed = False
+            return True, []
+        
+        projects = await self._parse_projects(raw)
+        if projects is None:
+            return False, None
+        if state is None:
+            return True, projects
+        
+        state.body_hash = digest
+        state.changed = True
+        state.first_page_ids = [project.id for project in projects]
+        
+        known_ids = state.known_ids
+        state.known_ids = set(state.first_page_ids)
+        if not known_ids:
+            return True, projects
+        
+        new_projects = [project for project in projects if project.id not in known_ids]
+        page_projects = projects
+        page = 1
+        
+        while page_projects and known_ids.isdisjoint(project.id for project in page_projects) and page < state.max_pages:
+            page += 1
+            raw = await self._get_projects_page(page)
+            page_projects = await self._parse_projects(raw) if raw is not None else None
+            if not page_projects:
+                break
+            state.known_ids.update(project.id for project in page_projects)
+            new_projects.extend(project for project in page_projects if project.id not in known_ids)
+        
+        return True, new_projects
+    
+    async def _get_projects_page(self, page: int) -> Optional[bytes]:
+        url = str((KWORK_URL / "projects").with_query(a=1, page=page))
         body = self.create_body(a=1)
-        projects = []
-
-        async with self.session.post(url, headers=self.headers, data=body) as response:
-            if response.status == 200:
-                response_data = await response.json()
-                if response_data["success"]:
-                    projects.extend(response_data["data"]["pagination"]["data"])
-                else:
-                    logging.error(f"Failed to get projects with error: {response_data['error']}")
-                    return False, None
-            else:
+        
+        async with self.session.post(url, headers=self.request_headers(url), data=body, allow_redirects=False) as response:
+            self.store_cookies(response)
+            if response.status != 200:
+                self.session_expired = response.status in (301, 302, 401, 403)
                 logging.error(f"Failed to get projects with status code: {response.status}")
-                return False, None
-            
-        return True, projects
+                return None
+            return await response.read()
+    
+    async def _parse_projects(self, raw: bytes) -> Optional[List[Project]]:
+        projects, error = await offloader.run(decode_projects, raw, size=len(raw))
+        if error is not None:
+            self.session_expired = True
+            logging.error(f"Failed to get projects: {error}")
+        return projects
+    
+    def request_headers(self, url: str) -> Dict[str, str]:
+        """Get the request headers with cookies of the user's jar.
+
+        Args:
+            url (str): Request URL.
+
+        Returns:
+            Dict[str, str]: Headers.
+        """
+        if self.cookie_jar is None or "Cookie" in self.headers:
+            return self.headers
+        
+        cookies = self.cookie_jar.filter_cookies(URL(url))
+        if not cookies:
+            return self.headers
+        
+        headers = dict(self.headers)
+        headers["Cookie"] = "; ".join(f"{key}={morsel.value}" for key, morsel in cookies.items())
+        return headers
+    
+    def store_cookies(self, response: ClientResponse) -> None:
+        if self.cookie_jar is not None and response.cookies:
+            self.cookie_jar.update_cookies(response.cookies, response.url)
     
     def create_body(self, **kwargs) -> str:
         """Create the request body.
@@ -130,7 +261,29 @@ class KworkAPI(object):
         body += "-----WebKitFormBoundary--"
         return body
             
-    async def get_file_content(self, url: str) -> bytes:
-        async with self.session.get(url, headers=self.headers) as response:
-            return await response.content.read()
+    @KWORK_SECONDS.labels("get_file_content").timed
+    async def get_file_content(self, url: str, max_size: Optional[int] = None) -> Optional[bytes]:
+        """Download a file, reading the response in chunks.
+
+        Args:
+            url (str): File URL.
+            max_size (Optional[int]): Size limit in bytes, the download is aborted once it's exceeded.
+
+        Returns:
+            Optional[bytes]: File content or None if the request failed or the file is too large.
+        """
+        async with self.session.get(url, headers=self.request_headers(url)) as response:
+            if response.status != 200:
+                logging.error(f"Failed to get file with status code: {response.status}")
+                return None
+            
+            if max_size is not None and (response.content_length or 0) > max_size:
+                return None
+            
+            content = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                content.extend(chunk)
+                if max_size is not None and len(content) > max_size:
+                    return None
+            return bytes(content)
             
\ No newline at end of file
@@ -0,0 +1,43 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+
+@dataclass(slots=True, frozen=True)
+class ProjectFile:
+    url: str
+    fname: str
+
+
+@dataclass(slots=True)
+class Project:
+    """Kwork project with only the fields the bot uses."""
+    id: int
+    name: str
+    description: str
+    price_limit: float
+    possible_price_limit: float
+    profile_url: str
+    active_wants: int
+    time_left: str
+    kwork_count: int
+    wants_count: int
+    wants_hired_percent: int
+    files: Tuple[ProjectFile, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Project":
+        user = (data.get("user") or {}).get("data") or {}
+        return cls(
+            id=int(data["id"]),
+            name=data.get("name") or "",
+            description=data.get("description") or "",
+            price_limit=float(data.get("priceLimit") or 0),
+            possible_price_limit=float(data.get("possiblePriceLimit") or 0),
+            profile_url=data.get("wantUserGetProfileUrl") or "",
+            active_wants=int(data.get("getWantsActiveCount") or 0),
+            time_left=str(data.get("timeLeft") or ""),
+            kwork_count=int(data.get("kwork_count") or 0),
+            wants_count=int(user.get("wants_count") or 0),
+            wants_hired_percent=int(float(user.get("wants_hired_percent") or 0)),
+            files=tuple(ProjectFile(url=file["url"], fname=file["fname"]) for file in data.get("files") or ())
+        )
@@ -0,0 +1,112 @@
+import logging
+from typing import Dict, Optional
+
+from aiohttp import ClientSession, ClientTimeout, CookieJar, DummyCookieJar, TCPConnector
+from yarl import URL
+
+from config_reader import config
+
+
+KWORK_URL = URL(config.KWORK_BASE_URL).with_path("/")
+
+
+class HttpPool(object):
+    """Application-scoped HTTP connection pool.
+
+    One `ClientSession` with a bounded keep-alive connector and a DNS cache is shared by
+    every Kwork request, so polls reuse open TCP+TLS connections instead of paying a new
+    handshake each time. The shared session does not store cookies itself: every user gets
+    an own `CookieJar` layered on top, which is passed to `KworkAPI`.
+    """
+
+    def __init__(
+        self,
+        limit: int = config.HTTP_POOL_LIMIT,
+        limit_per_host: int = config.HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache: int = config.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout: float = config.HTTP_KEEPALIVE_TIMEOUT,
+        timeout: float = config.HTTP_TIMEOUT
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._session: Optional[ClientSession] = None
+        self._cookie_jars: Dict[int, CookieJar] = {}
+
+    async def start(self) -> None:
+        if self._session is not None and not self._session.closed:
+            return
+
+        connector = TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.ttl_dns_cache,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        self._session = ClientSession(
+            connector=connector,
+            cookie_jar=DummyCookieJar(),
+            timeout=ClientTimeout(total=self.timeout)
+        )
+        logging.info(f"HTTP pool started (limit={self.limit}, limit_per_host={self.limit_per_host})")
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._cookie_jars.clear()
+
+    @property
+    def session(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HTTP pool is not started")
+        return self._session
+
+    def cookie_jar(self, user_id: int, cookie: Optional[str] = None) -> CookieJar:
+        """Get the cookie jar of the user.
+
+        Args:
+            user_id (int): Telegram user ID.
+            cookie (Optional[str]): Stored cookie string used to fill a new jar.
+
+        Returns:
+            CookieJar: Cookie jar of the user.
+        """
+        jar = self._cookie_jars.get(user_id)
+        if jar is None:
+            jar = CookieJar()
+            if cookie:
+                load_cookie_string(jar, cookie)
+            self._cookie_jars[user_id] = jar
+        return jar
+
+    def forget(self, user_id: int) -> None:
+        self._cookie_jars.pop(user_id, None)
+
+    def kwork(self, user_id: Optional[int] = None, cookie: Optional[str] = None) -> "KworkAPI":
+        """Create a Kwork API client on top of the shared session.
+
+        Args:
+            user_id (Optional[int]): Telegram user ID, anonymous client with an own jar if None.
+            cookie (Optional[str]): Stored cookie string used to fill a new jar.
+
+        Returns:
+            KworkAPI: Kwork API client.
+        """
+        from .kwork import KworkAPI
+
+        jar = self.cookie_jar(user_id, cookie) if user_id is not None else CookieJar()
+        return KworkAPI(self.session, cookie_jar=jar)
+
+
+def load_cookie_string(jar: CookieJar, cookie: str) -> None:
+    """Load a `name=value; name2=value2` string into the jar."""
+    cookies = {}
+    for part in cookie.split(";"):
+        name, _, value = part.strip().partition("=")
+        if name:
+            cookies[name] = value
+    jar.update_cookies(cookies, response_url=KWORK_URL)
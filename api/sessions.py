@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config_reader import config
+from cryptographer import encrypt_async, decrypt_async, decrypt_cookie, invalidate_cookie
+from db import KworkSession
+from .kwork import cookie_string
+from .pool import HttpPool
+
+
+class KworkSessionManager(object):
+    """Kwork cookies with lazy re-login.
+
+    Stored cookies are reused while Kwork accepts them. When a request reports an expired
+    session the account is logged in again with the stored credentials: concurrent re-logins
+    of one account share a single attempt, an account is re-logged at most once per
+    `relogin_interval`, logins of all accounts are spaced by `login_spacing` and an account
+    that hit the captcha is left alone for `captcha_backoff`, so the bot stays off the
+    `recaptcha_pass_token` path.
+    """
+
+    def __init__(
+        self,
+        http_pool: HttpPool,
+        sessionmaker: async_sessionmaker,
+        relogin_interval: float = config.KWORK_RELOGIN_INTERVAL,
+        login_spacing: float = config.KWORK_LOGIN_SPACING,
+        captcha_backoff: float = config.KWORK_CAPTCHA_BACKOFF,
+        max_failures: int = 3
+    ) -> None:
+        self.http_pool = http_pool
+        self.sessionmaker = sessionmaker
+        self.relogin_interval = relogin_interval
+        self.login_spacing = login_spacing
+        self.captcha_backoff = captcha_backoff
+        self.max_failures = max_failures
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._not_before: Dict[int, float] = {}
+        self._captcha_until: Dict[int, float] = {}
+        self._failures: Dict[int, int] = {}
+        self._spacing_lock = asyncio.Lock()
+        self._next_login = 0.0
+
+    def failures(self, user_id: int) -> int:
+        return self._failures.get(user_id, 0)
+
+    def forget(self, user_id: int) -> None:
+        self._not_before.pop(user_id, None)
+        self._failures.pop(user_id, None)
+
+    async def validate(self, user_id: int, cookie: Optional[bytes]) -> bool:
+        """Check whether Kwork still accepts the stored cookie.
+
+        Args:
+            user_id (int): Telegram user ID.
+            cookie (Optional[bytes]): Encrypted cookie.
+
+        Returns:
+            bool: True if the cookie is valid.
+        """
+        cookie_str = decrypt_cookie(user_id, cookie)
+        if not cookie_str:
+            return False
+
+        kwork = self.http_pool.kwork(user_id, cookie_str)
+        success, _ = await kwork.get_projects()
+        return success
+
+    async def relogin(self, user_id: int, force: bool = False) -> Optional[bytes]:
+        """Log in again with the stored credentials and save the new cookie.
+
+        Args:
+            user_id (int): Telegram user ID.
+            force (bool): Ignore `relogin_interval` (the user asked for it), the captcha backoff still applies.
+
+        Returns:
+            Optional[bytes]: New encrypted cookie or None if the login failed or was postponed.
+        """
+        future = self._inflight.get(user_id)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        now = time.monotonic()
+        if now < self._captcha_until.get(user_id, 0):
+            return None
+        if not force and now < self._not_before.get(user_id, 0):
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        cookie = None
+        try:
+            cookie = await self._login(user_id)
+        except Exception as e:
+            logging.error(f"Relogin failed for user_id {user_id}: {e}")
+        finally:
+            self._not_before[user_id] = time.monotonic() + self.relogin_interval
+            if cookie is None:
+                self._failures[user_id] = self._failures.get(user_id, 0) + 1
+            else:
+                self._failures.pop(user_id, None)
+            future.set_result(cookie)
+            del self._inflight[user_id]
+        return cookie
+
+    async def _wait_spacing(self) -> None:
+        async with self._spacing_lock:
+            delay = self._next_login - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_login = time.monotonic() + self.login_spacing
+
+    async def _login(self, user_id: int) -> Optional[bytes]:
+        async with self.sessionmaker() as db_session:
+            kwork_session = await db_session.get(KworkSession, user_id)
+            if kwork_session is None or not kwork_session.login:
+                return None
+
+            login = await decrypt_async(kwork_session.login)
+            password = await decrypt_async(kwork_session.password)
+            if login is None or password is None:
+                return None
+
+            await self._wait_spacing()
+            logging.info(f"Relogin to Kwork for user_id: {user_id}")
+            kwork = self.http_pool.kwork()
+            success, cookies, response_data = await kwork.login(login, password)
+
+            if not success:
+                if response_data and "captcha" in json.dumps(response_data).lower():
+                    self._captcha_until[user_id] = time.monotonic() + self.captcha_backoff
+                    logging.warning(f"Kwork asked for a captcha for user_id {user_id}, backing off for {self.captcha_backoff}s")
+                return None
+
+            cookie = await encrypt_async(cookie_string(cookies))
+            kwork_session.cookie = cookie
+            await db_session.commit()
+
+        invalidate_cookie(user_id)
+        self.http_pool.forget(user_id)
+        return cookie
@@ -0,0 +1,149 @@
+"""Local stand-ins of kwork.ru and the Telegram Bot API for benchmarks."""
+import asyncio
+import itertools
+import json
+import socket
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+
+class FakeKwork(object):
+    """kwork.ru login, projects feed and attachment files.
+
+    A user logged in as `user<N>` gets the cookie `sid=<feed>-<N>` and sees the feed
+    `N % feeds`. Every `advance()` publishes `churn` new projects in every feed, a page holds
+    the `page_size` newest projects of the feed and every `attachment_every`-th project has
+    `files_per_project` files of `attachment_size` bytes. Responses are delayed by `latency` seconds.
+    Set `base_url` before the first `advance()`, file URLs are built from it.
+    """
+
+    def __init__(
+        self,
+        feeds: int = 10,
+        churn: int = 1,
+        page_size: int = 12,
+        attachment_every: int = 5,
+        attachment_size: int = 64 * 1024,
+        files_per_project: int = 1,
+        latency: float = 0.05
+    ) -> None:
+        self.feeds = feeds
+        self.churn = churn
+        self.page_size = page_size
+        self.attachment_every = attachment_every
+        self.attachment_size = attachment_size
+        self.files_per_project = files_per_project
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self.base_url = ""
+        self._ids = itertools.count(1)
+        self._projects: Dict[int, List[dict]] = {feed: [] for feed in range(feeds)}
+        self._file = b"\0" * attachment_size
+
+    def advance(self, churn: Optional[int] = None) -> None:
+        for feed, projects in self._projects.items():
+            for _ in range(self.churn if churn is None else churn):
+                projects.insert(0, self._project(next(self._ids)))
+            del projects[self.page_size * 3:]
+
+    def _project(self, project_id: int) -> dict:
+        files = []
+        if self.attachment_every and project_id % self.attachment_every == 0:
+            for number in range(self.files_per_project):
+                files.append({"url": f"{self.base_url}/files/{project_id}-{number}.pdf", "fname": f"{project_id}-{number}.pdf"})
+        return {
+            "id": project_id,
+            "name": f"[:rocket] Проект {project_id}",
+            "description": "Нужно сделать лендинг [:smile]\nСроки — неделя\n" * 3,
+            "priceLimit": "5000.00",
+            "possiblePriceLimit": "15000.00",
+            "wantUserGetProfileUrl": f"https://kwork.ru/user/buyer{project_id % 97}",
+            "getWantsActiveCount": 2,
+            "timeLeft": "23 ч.",
+            "kwork_count": project_id % 7,
+            "user": {"data": {"wants_count": 17, "wants_hired_percent": 64}},
+            "files": files
+        }
+
+    async def login(self, request: web.Request) -> web.Response:
+        self.requests["login"] += 1
+        await asyncio.sleep(self.latency)
+        body = await request.json()
+        user_id = int(body["l_username"].removeprefix("user"))
+        response = web.json_response({"success": True})
+        response.set_cookie("sid", f"{user_id % self.feeds}-{user_id}")
+        return response
+
+    async def projects(self, request: web.Request) -> web.Response:
+        self.requests["projects"] += 1
+        await asyncio.sleep(self.latency)
+        sid = request.cookies.get("sid")
+        if sid is None:
+            return web.Response(status=302, headers={"Location": "/login"})
+        page = int(request.query.get("page", 1))
+        feed = self._projects[int(sid.split("-")[0])]
+        data = feed[(page - 1) * self.page_size:page * self.page_size]
+        return web.Response(body=json.dumps({"success": True, "data": {"pagination": {"data": data}}}), content_type="application/json")
+
+    async def file(self, request: web.Request) -> web.Response:
+        self.requests["files"] += 1
+        await asyncio.sleep(self.latency)
+        return web.Response(body=self._file, content_type="application/pdf")
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/user/login", self.login)
+        app.router.add_post("/projects", self.projects)
+        app.router.add_get("/files/{name}", self.file)
+        return app
+
+
+class FakeTelegram(object):
+    """Bot API sink answering every method with a minimal successful result."""
+
+    def __init__(self, latency: float = 0.02) -> None:
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.requests[method] += 1
+        await asyncio.sleep(self.latency)
+        form = await request.post()
+        message = {
+            "message_id": next(self._message_ids),
+            "date": 0,
+            "chat": {"id": int(form.get("chat_id", 0)), "type": "private"}
+        }
+        if method == "sendDocument":
+            message["document"] = self._document(message["message_id"])
+        if method == "sendMediaGroup":
+            album = [dict(message, message_id=next(self._message_ids)) for _ in json.loads(form["media"])]
+            for item in album:
+                item["document"] = self._document(item["message_id"])
+            return web.json_response({"ok": True, "result": album})
+        return web.json_response({"ok": True, "result": message if method.startswith("send") else True})
+
+    def _document(self, message_id: int) -> dict:
+        return {"file_id": f"file-{message_id}", "file_unique_id": str(message_id)}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
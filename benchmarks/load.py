@@ -0,0 +1,170 @@
+"""Load test of the tracking pipeline against local fakes of kwork.ru and Telegram.
+
+Simulated users log in to the fake Kwork, are subscribed to `ProjectsPoller` and every
+tick polls all feeds (`slot=None`), so `KworkAPI`, `projects_tracking`, the attachment
+pipeline, the sender and the state buffer all run as in production.
+
+Usage: python -m benchmarks.load [--users 1000] [--feeds 50] [--ticks 20] [--churn 1]
+                                 [--attachment-size 65536] [--latency 0.05]
+                                 [--files-per-project 1] [--delivery-mode instant]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fakes import FakeKwork, FakeTelegram, free_port, serve
+
+KWORK_PORT = free_port()
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="kwork-bench-"), "bench.sqlite3")
+# The config is read on import, so the stand-ins are configured before the bot modules load.
+os.environ.update(
+    BOT_TOKEN="42:benchmark",
+    DB_URL=f"sqlite+aiosqlite:///{DB_PATH}",
+    KWORK_BASE_URL=f"http://localhost:{KWORK_PORT}"
+)
+
+import asyncio  # noqa: E402
+import logging  # noqa: E402
+import resource  # noqa: E402
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+from api import HttpPool, KworkSessionManager  # noqa: E402
+from api.kwork import cookie_string  # noqa: E402
+from bot.utils.attachments import AttachmentPipeline  # noqa: E402
+from bot.utils.loop_monitor import LoopLagMonitor  # noqa: E402
+from bot.utils.poller import ProjectsPoller  # noqa: E402
+from bot.utils.sender import TelegramSender  # noqa: E402
+from config_reader import DELIVERY_MODES, config  # noqa: E402
+from cryptographer import encrypt  # noqa: E402
+from db import _engine, _sessionmaker, bootstrap_schema, SeenProjectsStore, TrackingStateBuffer  # noqa: E402
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list, q: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+async def login_users(http_pool: HttpPool, users: int, concurrency: int = 50) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(user_id: int) -> tuple:
+        async with semaphore:
+            success, cookies, _ = await http_pool.kwork().login(f"user{user_id}", "password")
+            return user_id, encrypt(cookie_string(cookies)) if success else None
+
+    return dict(await asyncio.gather(*(login(user_id) for user_id in range(1, users + 1))))
+
+
+async def run(args: argparse.Namespace) -> None:
+    # Sends still in flight when the drain timeout expires are cancelled, the fake Bot API
+    # would log every dropped upload.
+    logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)
+    kwork = FakeKwork(
+        feeds=args.feeds,
+        churn=args.churn,
+        attachment_every=args.attachment_every,
+        attachment_size=args.attachment_size,
+        files_per_project=args.files_per_project,
+        latency=args.latency
+    )
+    kwork.base_url = f"http://localhost:{KWORK_PORT}"
+    kwork.advance(kwork.page_size)
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    telegram_port = free_port()
+    runners = [await serve(kwork.app(), KWORK_PORT), await serve(telegram.app(), telegram_port)]
+
+    await bootstrap_schema(_engine)
+    bot = Bot("42:benchmark", session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{telegram_port}")))
+    http_pool = HttpPool()
+    await http_pool.start()
+    sessions = KworkSessionManager(http_pool, _sessionmaker)
+    state_buffer = TrackingStateBuffer(_sessionmaker)
+    seen_store = SeenProjectsStore(state_buffer)
+    attachments = AttachmentPipeline()
+    sender = TelegramSender(
+        bot,
+        attachments,
+        workers=args.send_workers,
+        global_rate=args.send_rate,
+        chat_rate=args.send_rate,
+        chat_burst=args.send_rate,
+        on_delivered=state_buffer.delivered,
+        on_seen=seen_store.mark_seen
+    )
+    poller = ProjectsPoller(http_pool, seen_store, sender, attachments, sessions)
+    monitor = LoopLagMonitor(interval=0.01, warning=float("inf"))
+
+    started = time.perf_counter()
+    cookies = await login_users(http_pool, args.users)
+    print(f"Logged in {args.users} users in {time.perf_counter() - started:.2f}s")
+    for user_id, cookie in cookies.items():
+        poller.subscribe(user_id, user_id, cookie)
+        poller.set_delivery_mode(user_id, args.delivery_mode)
+
+    state_buffer.start()
+    await sender.start()
+    monitor.start()
+
+    durations = []
+    started = time.perf_counter()
+    for _ in range(args.ticks):
+        kwork.advance()
+        tick_started = time.perf_counter()
+        await poller.tick()
+        durations.append(time.perf_counter() - tick_started)
+    elapsed = time.perf_counter() - started
+
+    await poller.digests.flush_all()
+    await sender.stop(timeout=args.drain_timeout)
+    await state_buffer.stop()
+    await monitor.stop()
+    await http_pool.close()
+    await bot.session.close()
+    for runner in runners:
+        await runner.cleanup()
+    await _engine.dispose()
+
+    kwork_requests = sum(kwork.requests.values()) - kwork.requests["login"]
+    print(f"users={args.users} feeds={args.feeds} (grouped into {poller.feeds_count}) ticks={args.ticks} churn={args.churn} delivery={args.delivery_mode}")
+    print(f"ticks/s:       {args.ticks / elapsed:.2f}")
+    print(f"tick latency:  p50 {percentile(durations, 50) * 1000:.1f}ms, p99 {percentile(durations, 99) * 1000:.1f}ms")
+    print(f"kwork:         {kwork_requests} requests ({dict(kwork.requests)}), {kwork_requests / args.ticks:.1f} per tick")
+    print(f"telegram:      {sum(telegram.requests.values())} requests ({dict(telegram.requests)}), {sender.pending} left undelivered")
+    print(f"rss:           {rss_mb():.1f} MB")
+    print(f"loop lag:      avg {monitor.stats.avg_lag * 1000:.1f}ms, max {monitor.stats.max_lag * 1000:.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--feeds", type=int, default=50, help="distinct category selections")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--churn", type=int, default=1, help="new projects per feed per tick")
+    parser.add_argument("--attachment-every", type=int, default=5, help="every N-th project has a file, 0 for none")
+    parser.add_argument("--attachment-size", type=int, default=64 * 1024)
+    parser.add_argument("--files-per-project", type=int, default=1)
+    parser.add_argument("--delivery-mode", choices=DELIVERY_MODES, default=config.DELIVERY_MODE)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Kwork response delay, s")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="fake Bot API response delay, s")
+    parser.add_argument("--send-workers", type=int, default=64)
+    parser.add_argument("--send-rate", type=float, default=1000, help="sender global and per-chat rate")
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Event loop lag while decoding large projects pages inline and in the offload pool.
+
+Usage: python -m benchmarks.offload [--pages 20] [--projects 200] [--executor thread|process]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from api.kwork import decode_projects
+from bot.utils.loop_monitor import LoopLagMonitor
+from offload import Offloader
+
+
+def make_page(projects: int) -> bytes:
+    return json.dumps({"success": True, "data": {"pagination": {"data": [
+        {
+            "id": project_id,
+            "name": f"Проект {project_id}",
+            "description": "Описание проекта [:smile]\n" * 20,
+            "priceLimit": "5000.00",
+            "possiblePriceLimit": "15000.00",
+            "wantUserGetProfileUrl": f"https://kwork.ru/user/buyer{project_id}",
+            "getWantsActiveCount": 2,
+            "timeLeft": "23 ч.",
+            "kwork_count": 4,
+            "user": {"data": {"wants_count": 17, "wants_hired_percent": 64}},
+            "files": []
+        }
+        for project_id in range(projects)
+    ]}}}).encode()
+
+
+async def measure(offloader: Offloader, page: bytes, pages: int) -> LoopLagMonitor:
+    monitor = LoopLagMonitor(interval=0.005, warning=float("inf"))
+    monitor.start()
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    await asyncio.gather(*(offloader.run(decode_projects, page, size=len(page)) for _ in range(pages)))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    print(f"{offloader.kind:>8}: {pages / elapsed:6.1f} pages/s, loop lag max {monitor.stats.max_lag * 1000:6.1f}ms avg {monitor.stats.avg_lag * 1000:5.1f}ms")
+    return monitor
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--executor", choices=("thread", "process"), default="process")
+    args = parser.parse_args()
+
+    page = make_page(args.projects)
+    print(f"{args.pages} pages of {len(page) // 1024} KB")
+
+    await measure(Offloader(kind="none"), page, args.pages)
+    offloader = Offloader(kind=args.executor, threshold=0)
+    await measure(offloader, page, args.pages)
+    offloader.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
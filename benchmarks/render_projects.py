@@ -0,0 +1,67 @@
+"""Project rendering throughput with and without the render cache.
+
+Usage: python -m benchmarks.render_projects [--projects 200] [--recipients 50]
+"""
+import argparse
+import time
+from typing import Any, Callable, List
+
+from api import Project
+from bot.handlers import localization as loc
+from bot.handlers import keyboards as kb
+from bot.utils.render import ProjectRenderer
+
+
+def make_project(project_id: int) -> Project:
+    return Project.from_dict({
+        "id": project_id,
+        "name": f"[:rocket] Лендинг для проекта {project_id} [:fire-red]",
+        "description": "Нужно сверстать лендинг по макету [:smile]\nАдаптив под мобильные\n" * 5,
+        "priceLimit": "5000.00",
+        "possiblePriceLimit": "15000.00",
+        "wantUserGetProfileUrl": f"https://kwork.ru/user/buyer{project_id}",
+        "getWantsActiveCount": 2,
+        "timeLeft": "23 ч. 59 мин.",
+        "kwork_count": 4,
+        "user": {"data": {"wants_count": 17, "wants_hired_percent": 64}},
+        "files": [{"url": f"https://kwork.ru/files/{project_id}.pdf", "fname": "tz.pdf"}]
+    })
+
+
+def render_uncached(project: Project) -> None:
+    loc.remove_emojis(project.name)
+    loc.project_info(project, True)
+    kb.project_keyboard(project_id=project.id)
+
+
+def measure(projects: List[Project], recipients: int, render: Callable[[Project], Any]) -> float:
+    started = time.perf_counter()
+    for project in projects:
+        for _ in range(recipients):
+            render(project)
+    return len(projects) * recipients / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--recipients", type=int, default=50)
+    args = parser.parse_args()
+
+    projects = [make_project(project_id) for project_id in range(args.projects)]
+    renderer = ProjectRenderer(maxsize=args.projects)
+
+    def render_cached(project: Project) -> None:
+        rendered = renderer.render(project)
+        rendered.message(True)
+
+    uncached = measure(projects, args.recipients, render_uncached)
+    cached = measure(projects, args.recipients, render_cached)
+
+    print(f"{args.projects} projects x {args.recipients} recipients")
+    print(f"uncached: {uncached:,.0f} projects/s")
+    print(f"cached:   {cached:,.0f} projects/s ({cached / uncached:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
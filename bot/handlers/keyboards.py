@@ -1,6 +1,6 @@
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, ReplyKeyboardMarkup, KeyboardButton
+from typing import List, Optional
 
-from db import User
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, ReplyKeyboardMarkup, KeyboardButton
 
 
 def main_keyboard() -> ReplyKeyboardMarkup:
@@ -10,32 +10,60 @@ def main_keyboard() -> ReplyKeyboardMarkup:
     ], resize_keyboard=True)
 
 
-def project_keyboard(project_id: int) -> InlineKeyboardMarkup:
-    buttons = [
-        [InlineKeyboardButton(
-            text="Открыть проект", 
+def project_buttons(project_id: int, number: Optional[int] = None) -> List[InlineKeyboardButton]:
+    prefix = f"{number}. " if number is not None else ""
+    return [
+        InlineKeyboardButton(
+            text=f"{prefix}Открыть проект", 
             url=f"https://kwork.ru/projects/{project_id}/view"
-        )],
-        [InlineKeyboardButton(
-            text="Предложить услугу", 
+        ),
+        InlineKeyboardButton(
+            text=f"{prefix}Предложить услугу", 
             url=f"https://kwork.ru/new_offer?project={project_id}"
-        )],
-        [InlineKeyboardButton(
-            text="🗑 Скрыть", 
-            callback_data=f"hide_project"
-        )],
+        ),
     ]
+
+
+def project_keyboard(project_id: int) -> InlineKeyboardMarkup:
+    buttons = [[button] for button in project_buttons(project_id)]
+    buttons.append([InlineKeyboardButton(
+        text="🗑 Скрыть", 
+        callback_data=f"hide_project"
+    )])
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
     
     
-def profile_keyboard(user: User) -> InlineKeyboardMarkup:
+def digest_keyboard(project_ids: List[int]) -> InlineKeyboardMarkup:
+    buttons = [project_buttons(project_id, number) for number, project_id in enumerate(project_ids, 1)]
+    buttons.append([InlineKeyboardButton(text="🗑 Скрыть", callback_data="hide_project")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+    
+    
+def profile_keyboard(tracking: bool) -> InlineKeyboardMarkup:
     buttons = []
-    if user.kwork_session.cookie:
+    if tracking:
         buttons.append([InlineKeyboardButton(text="Выключить отслеживание проектов", callback_data="disable_tracking")])
     else:
         buttons.append([InlineKeyboardButton(text="Включить отслеживание проектов", callback_data="enable_tracking")])
+    buttons.append([InlineKeyboardButton(text="🎯 Фильтры проектов", callback_data="filters")])
+    buttons.append([InlineKeyboardButton(text="📬 Режим доставки", callback_data="delivery")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+    
+    
+def delivery_keyboard(mode: str) -> InlineKeyboardMarkup:
+    titles = {"auto": "Авто", "instant": "Сразу", "digest": "Сводкой"}
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"✅ {title}" if value == mode else title, callback_data=f"delivery_mode:{value}")]
+        for value, title in titles.items()
+    ])
+    
+    
+def filters_keyboard(has_filter: bool) -> InlineKeyboardMarkup:
+    buttons = [[InlineKeyboardButton(text="✏️ Изменить", callback_data="edit_filters")]]
+    if has_filter:
+        buttons.append([InlineKeyboardButton(text="🧹 Сбросить", callback_data="reset_filters")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
     
     
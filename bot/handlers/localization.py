@@ -1,9 +1,15 @@
 import re
-from typing import Dict, Any, Optional
+from html import escape
+from typing import List, Optional
 
+from api import Project
+from bot.utils.filters import UserFilter
 from config_reader import config
 
 
+EMOJI_PATTERN = re.compile(r'\s*\[:\w+-?\w*\]\s*')
+
+
 def remove_emojis(text: str) -> str:
     """Remove emojis from the text.
 
@@ -13,9 +19,9 @@ def remove_emojis(text: str) -> str:
     Returns:
         str: Text without emojis.
     """
-    lines = text.split('\n')
-    cleaned_lines = [re.sub(r'\s*\[:\w+-?\w*\]\s*', ' ', line).strip() for line in lines]
-    return '\n'.join(cleaned_lines)
+    if '[:' not in text:
+        return '\n'.join(line.strip() for line in text.split('\n'))
+    return '\n'.join(EMOJI_PATTERN.sub(' ', line).strip() for line in text.split('\n'))
 
 
 def start_message(first_name: str) -> str:
@@ -26,31 +32,55 @@ def start_message(first_name: str) -> str:
            "🔎 Советуем ознакомиться с инструкцией перед использованием бота в разделе <i>💬 Помощь</i>."
 
 
-def project_info(data: Dict[str, Any], attachment: bool) -> str:
-    username = data['wantUserGetProfileUrl'].split('/')[-1]
+def project_info(project: Project, attachment: bool) -> str:
+    username = project.profile_url.split('/')[-1]
     profile_url = f"https://kwork.ru/user/{username}"
     projects_url = f"https://kwork.ru/projects/list/{username}"
     
-    cleaned_name = remove_emojis(data['name'])
-    cleaned_description = remove_emojis(data['description'])
+    cleaned_name = remove_emojis(project.name)
+    cleaned_description = remove_emojis(project.description)
     
     text = f"<blockquote><b>{cleaned_name}</b>\n\n" \
            f"{cleaned_description.replace('\n', '\n\n')}</blockquote>\n\n" \
-           f"Желаемый бюджет: до {int(float(data['priceLimit']))} ₽\n" \
-           f"Допустимый: до {int(float(data['possiblePriceLimit']))} ₽\n\n" \
+           f"Желаемый бюджет: до {int(project.price_limit)} ₽\n" \
+           f"Допустимый: до {int(project.possible_price_limit)} ₽\n\n" \
            f"Покупатель: <a href='{profile_url}'>{username}</a>\n" \
-           f"Размещено проектов на бирже: {data['user']['data']['wants_count']}   " \
-           f"<a href='{projects_url}'>Смотреть открытые ({data['getWantsActiveCount']})</a>\n" \
-           f"Нанято: {data['user']['data']['wants_hired_percent']}%\n\n" \
-           f"Осталось: {data['timeLeft']}\n" \
-           f"Предложений: {data['kwork_count']}"
+           f"Размещено проектов на бирже: {project.wants_count}   " \
+           f"<a href='{projects_url}'>Смотреть открытые ({project.active_wants})</a>\n" \
+           f"Нанято: {project.wants_hired_percent}%\n\n" \
+           f"Осталось: {project.time_left}\n" \
+           f"Предложений: {project.kwork_count}"
            
     if attachment:
-        text += "\n\n📎 Над сообщением прикреплены вложения"
+        text += attachment_note()
         
     return text
+
+
+def attachment_note() -> str:
+    return "\n\n📎 Над сообщением прикреплены вложения"
     
     
+def projects_digest(projects: List[Project], attachments: List[bool]) -> str:
+    lines = [f"📬 <b>Новые проекты: {len(projects)}</b>"]
+    for number, (project, attachment) in enumerate(zip(projects, attachments), 1):
+        name = remove_emojis(project.name)
+        if len(name) > 80:
+            name = name[:79].rstrip() + "…"
+        lines.append(
+            f"{number}. <a href='https://kwork.ru/projects/{project.id}/view'><b>{escape(name)}</b></a>{' 📎' if attachment else ''}\n"
+            f"До {int(project.price_limit)} ₽ · предложений: {project.kwork_count} · осталось: {project.time_left}"
+        )
+    return "\n\n".join(lines)
+
+
+def delivery_mode(mode: str) -> str:
+    return "📬 <b>Режим доставки проектов</b>\n\n" \
+           f"{'✅' if mode == 'auto' else '▫️'} <b>Авто</b> — по одному, а при наплыве проектов одной сводкой.\n" \
+           f"{'✅' if mode == 'instant' else '▫️'} <b>Сразу</b> — каждый проект отдельным сообщением.\n" \
+           f"{'✅' if mode == 'digest' else '▫️'} <b>Сводкой</b> — новые проекты собираются в одно сообщение раз в {config.DIGEST_WINDOW / 60:g} мин."
+
+
 def user_profile(first_name: str, user_id: int) -> str:
     return f"👤 <b>{first_name}</b>\n\n" \
            f"🏷 <b>ID:</b> <code>{user_id}</code>"
@@ -78,6 +108,53 @@ def projects_tracking_disabled() -> str:
     return "🔕 Отслеживание проектов выключено"
 
 
+def projects_tracking_stopped() -> str:
+    return "⚠️ Бот был перезапущен, и отслеживание проектов остановлено.\n\nВключи его снова в разделе <i>👤 Профиль</i>."
+
+
+def project_filters(user_filter: Optional[UserFilter]) -> str:
+    if user_filter is None or user_filter.empty:
+        return "🎯 Фильтры не заданы, приходят все проекты из выбранных рубрик."
+    
+    lines = []
+    if user_filter.keywords:
+        lines.append(f"Слова: {escape(', '.join(user_filter.keywords))}")
+    if user_filter.negative_keywords:
+        lines.append(f"Минус-слова: {escape(', '.join(user_filter.negative_keywords))}")
+    if user_filter.min_price is not None:
+        lines.append(f"Бюджет от: {user_filter.min_price} ₽")
+    if user_filter.min_possible_price is not None:
+        lines.append(f"Допустимый от: {user_filter.min_possible_price} ₽")
+    if user_filter.min_hired_percent is not None:
+        lines.append(f"Нанято от: {user_filter.min_hired_percent}%")
+    if user_filter.max_kwork_count is not None:
+        lines.append(f"Предложений до: {user_filter.max_kwork_count}")
+    return "🎯 <b>Фильтры проектов</b>\n\n" + "\n".join(lines)
+
+
+def get_filters() -> str:
+    return "Отправь фильтры одним сообщением, каждый с новой строки (ненужные строки можно пропустить):\n\n" \
+           "<code>слова: парсер, telegram бот\n" \
+           "минус: битрикс, 1с\n" \
+           "бюджет от: 5000\n" \
+           "допустимый от: 10000\n" \
+           "нанято от: 30\n" \
+           "предложений до: 10</code>\n\n" \
+           "Проект подходит, если в названии или описании есть хотя бы одно из слов и нет ни одного минус-слова."
+
+
+def error_filters(line: str) -> str:
+    return f"⚠️ Не удалось разобрать строку: <i>{escape(line)}</i>\n\nПроверь формат и отправь фильтры еще раз."
+
+
+def filters_saved() -> str:
+    return "✅ Фильтры сохранены"
+
+
+def filters_reset() -> str:
+    return "🧹 Фильтры сброшены"
+
+
 def help_sections() -> str:  
     return "Выбери раздел:"
 
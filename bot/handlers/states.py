@@ -3,4 +3,5 @@ from aiogram.filters.state import State, StatesGroup
 
 class States(StatesGroup):
     get_login = State()
-    get_password = State()
\ No newline at end of file
+    get_password = State()
+    get_filters = State()
\ No newline at end of file
@@ -1,50 +1,43 @@
-from aiohttp import ClientSession
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from typing import TYPE_CHECKING
+
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import localization as loc, keyboards as kb
 from .states import States
-from api import KworkAPI
+from api import HttpPool, KworkSessionManager
 from api.kwork import auth
-from db import User
-from bot.utils import scheduler_func
-from cryptographer import encrypt, decrypt
+from db import enable_tracking, disable_tracking, is_tracking, get_filter, save_filter, delete_filter
+from bot.middlewares import UserContext
+from bot.utils.filters import UserFilter, parse_filter
+from config_reader import DELIVERY_MODES, config
+
+if TYPE_CHECKING:
+    from bot.utils.poller import ProjectsPoller
 
 
 router = Router()
 
 
 @router.message(CommandStart())
-async def start_handler(message: Message, db_session: AsyncSession) -> None:
+async def start_handler(message: Message, user_context: UserContext) -> None:
     await message.answer(text=loc.start_message(message.from_user.first_name), reply_markup=kb.main_keyboard())
     
-    user = await db_session.scalar(
-        select(User)
-        .options(selectinload(User.kwork_session))
-        .where(User.id == message.from_user.id)
-    )
+    user = await user_context.get()
     
     if not user.kwork_session.login:
         await message.answer(text=loc.auth(), reply_markup=kb.auth_keyboard())
     
 
 @router.message(F.text == "👤 Профиль")
-async def profile_handler(message: Message, db_session: AsyncSession) -> None:
+async def profile_handler(message: Message, db_session: AsyncSession, poller: "ProjectsPoller") -> None:
     first_name = message.from_user.first_name
     user_id = message.from_user.id
-    user = await db_session.scalar(
-        select(User)
-        .options(selectinload(User.kwork_session))
-        .where(User.id == user_id)
-    )
-        
-    await message.answer(text=loc.user_profile(first_name, user_id), reply_markup=kb.profile_keyboard(user))
+    tracking = poller.is_subscribed(user_id) if poller.owns(user_id) else await is_tracking(db_session, user_id)
+    await message.answer(text=loc.user_profile(first_name, user_id), reply_markup=kb.profile_keyboard(tracking))
 
 
 @router.message(F.text == "💬 Помощь")
@@ -53,73 +46,100 @@ async def help_handler(message: Message) -> None:
     
     
 @router.callback_query(F.data == "enable_tracking")
-async def enable_projects_tracking_handler(callback: CallbackQuery, db_session: AsyncSession, scheduler: AsyncIOScheduler) -> None:
-    user = await db_session.scalar(
-        select(User)
-        .options(selectinload(User.kwork_session))
-        .where(User.id == callback.from_user.id)
-    )
+async def enable_projects_tracking_handler(callback: CallbackQuery, db_session: AsyncSession, user_context: UserContext, poller: "ProjectsPoller", sessions: KworkSessionManager) -> None:
+    user = await user_context.get()
     
     if not user.kwork_session.login:
-        message = await callback.message.answer(
-            text=loc.enter_kwork_login(), 
-            reply_markup=kb.log_in_keyboard(
-                message_id=None
-            )
-        )
-        await message.edit_reply_markup(reply_markup=kb.log_in_keyboard(message_id=message.message_id))
+        await callback.answer()
+        await callback.message.answer(text=loc.auth(), reply_markup=kb.auth_keyboard())
         return
     
-    async with ClientSession() as session:
-        kwork = KworkAPI(session)
-        success, cookie, _ = await kwork.login(decrypt(user.kwork_session.login), decrypt(user.kwork_session.password))
-        
-        if not success:
-            await callback.message.answer(text=loc.error_auth(), reply_markup=kb.auth_keyboard())
-            return
-        
-        cookie_str = '; '.join([f"{key}={morsel.value}" for key, morsel in cookie.items()])
-        user.kwork_session.cookie = encrypt(cookie_str)
-        await db_session.commit()
-        
-        job_id = str(user.id)
-        if scheduler.get_job(job_id):
-            scheduler.remove_job(job_id)
-            
-        scheduler.add_job(
-            func=scheduler_func.projects_tracking, 
-            id=job_id, 
-            trigger="interval", 
-            minutes=1, 
-            kwargs={
-                "user": user, 
-                "message": callback.message, 
-                "db_session": db_session
-            }
-        )
-        
-        await callback.message.edit_reply_markup(reply_markup=kb.profile_keyboard(user))
-        await callback.answer(text=loc.projects_tracking_enabled())
-        
-        
+    cookie = user.kwork_session.cookie
+    if not await sessions.validate(user.id, cookie):
+        cookie = await sessions.relogin(user.id, force=True)
+    
+    if cookie is None:
+        await callback.answer()
+        await callback.message.answer(text=loc.error_auth(), reply_markup=kb.auth_keyboard())
+        return
+    
+    user.kwork_session.cookie = cookie
+    await enable_tracking(db_session, user.id, callback.message.chat.id)
+    await db_session.commit()
+    
+    poller.subscribe(user.id, callback.message.chat.id, cookie)
+    
+    await callback.message.edit_reply_markup(reply_markup=kb.profile_keyboard(True))
+    await callback.answer(text=loc.projects_tracking_enabled())
+    
+    
 @router.callback_query(F.data == "disable_tracking")
-async def disable_projects_tracking_handler(callback: CallbackQuery, db_session: AsyncSession, scheduler: AsyncIOScheduler) -> None:
-    user = await db_session.scalar(
-        select(User)
-        .options(selectinload(User.kwork_session))
-        .where(User.id == callback.from_user.id)
-    )
+async def disable_projects_tracking_handler(callback: CallbackQuery, db_session: AsyncSession, poller: "ProjectsPoller") -> None:
+    user_id = callback.from_user.id
     
     try:
-        scheduler.remove_job(str(user.id))
+        poller.unsubscribe(user_id)
     finally:
-        user.kwork_session.cookie = None
+        await disable_tracking(db_session, [user_id])
         await db_session.commit()
         
-        await callback.message.edit_reply_markup(reply_markup=kb.profile_keyboard(user))
+        await callback.message.edit_reply_markup(reply_markup=kb.profile_keyboard(False))
         await callback.answer(text=loc.projects_tracking_disabled())
     
     
+@router.callback_query(F.data == "filters")
+async def filters_handler(callback: CallbackQuery, db_session: AsyncSession) -> None:
+    row = await get_filter(db_session, callback.from_user.id)
+    user_filter = UserFilter.from_row(row) if row is not None else None
+    
+    await callback.answer()
+    await callback.message.answer(text=loc.project_filters(user_filter), reply_markup=kb.filters_keyboard(user_filter is not None))
+    
+    
+@router.callback_query(F.data == "edit_filters")
+async def edit_filters_handler(callback: CallbackQuery, state: FSMContext) -> None:
+    await callback.answer()
+    await callback.message.answer(text=loc.get_filters(), reply_markup=kb.cancel_keyboard())
+    await state.set_state(States.get_filters)
+    
+    
+@router.callback_query(F.data == "reset_filters")
+async def reset_filters_handler(callback: CallbackQuery, db_session: AsyncSession, poller: "ProjectsPoller") -> None:
+    user_id = callback.from_user.id
+    
+    await delete_filter(db_session, user_id)
+    await db_session.commit()
+    poller.set_filter(user_id, None)
+    
+    await callback.message.edit_text(text=loc.project_filters(None), reply_markup=kb.filters_keyboard(False))
+    await callback.answer(text=loc.filters_reset())
+    
+    
+@router.callback_query(F.data == "delivery")
+async def delivery_handler(callback: CallbackQuery, user_context: UserContext) -> None:
+    user = await user_context.get()
+    mode = user.delivery_mode or config.DELIVERY_MODE
+    
+    await callback.answer()
+    await callback.message.answer(text=loc.delivery_mode(mode), reply_markup=kb.delivery_keyboard(mode))
+    
+    
+@router.callback_query(F.data.startswith("delivery_mode:"))
+async def delivery_mode_handler(callback: CallbackQuery, db_session: AsyncSession, user_context: UserContext, poller: "ProjectsPoller") -> None:
+    user = await user_context.get()
+    mode = callback.data.split(":", 1)[1]
+    if mode not in DELIVERY_MODES or mode == (user.delivery_mode or config.DELIVERY_MODE):
+        await callback.answer()
+        return
+    
+    user.delivery_mode = mode
+    await db_session.commit()
+    poller.set_delivery_mode(user.id, mode)
+    
+    await callback.message.edit_text(text=loc.delivery_mode(mode), reply_markup=kb.delivery_keyboard(mode))
+    await callback.answer()
+    
+    
 @router.callback_query(F.data == "manual")
 async def manual_handler(callback: CallbackQuery) -> None:
     await callback.answer()
@@ -167,16 +187,37 @@ async def get_login_handler(message: Message, state: FSMContext) -> None:
     
 
 @router.message(StateFilter(States.get_password))
-async def get_password_handler(message: Message, state: FSMContext, db_session: AsyncSession) -> None:
+async def get_password_handler(message: Message, state: FSMContext, db_session: AsyncSession, http_pool: HttpPool) -> None:
     data = await state.get_data()
     await state.clear()
     
     login = data['login']
     password = message.text
     
-    success, err = await auth(login, password, message.from_user.id, db_session)
+    success, err = await auth(login, password, message.from_user.id, db_session, http_pool)
     if not success:
         await message.answer(text=loc.error_auth(err), reply_markup=kb.auth_keyboard())
         return
     
-    await message.answer(text=loc.successful_auth(), reply_markup=kb.main_keyboard())
\ No newline at end of file
+    await message.answer(text=loc.successful_auth(), reply_markup=kb.main_keyboard())
+    
+
+@router.message(StateFilter(States.get_filters))
+async def get_filters_handler(message: Message, state: FSMContext, db_session: AsyncSession, poller: "ProjectsPoller") -> None:
+    user_id = message.from_user.id
+    
+    try:
+        user_filter = parse_filter(message.text or "")
+    except ValueError as e:
+        await message.answer(text=loc.error_filters(str(e)), reply_markup=kb.cancel_keyboard())
+        return
+    
+    await state.clear()
+    if user_filter.empty:
+        await delete_filter(db_session, user_id)
+    else:
+        await save_filter(db_session, user_filter.to_row(user_id))
+    await db_session.commit()
+    poller.set_filter(user_id, user_filter)
+    
+    await message.answer(text=f"{loc.filters_saved()}\n\n{loc.project_filters(user_filter)}", reply_markup=kb.main_keyboard())
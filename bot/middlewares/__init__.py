@@ -1,2 +1,3 @@
-from .db_session import DBSessionMiddleware
-from .user_existence import CheckUserExistence
+from .db_session import DBSessionMiddleware, LazySession
+from .log_context import LogContextMiddleware
+from .user_existence import CheckUserExistence, UserContext, known_users
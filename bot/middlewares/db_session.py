@@ -1,8 +1,34 @@
-from typing import Callable, Awaitable, Any, Dict
+from typing import Callable, Awaitable, Any, Dict, Optional
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+class LazySession(object):
+    """Proxy of `AsyncSession` that creates the session on first use."""
+    
+    def __init__(self, session_pool: async_sessionmaker) -> None:
+        self._session_pool = session_pool
+        self._session: Optional[AsyncSession] = None
+        
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_pool()
+        return self._session
+    
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.session, name)
+    
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
 
 class DBSessionMiddleware(BaseMiddleware):
@@ -16,6 +42,9 @@ class DBSessionMiddleware(BaseMiddleware):
         event: Message | CallbackQuery,
         data: Dict[str, Any]
     ) -> Any:
-        async with self._session_pool() as session:
-            data["db_session"] = session
+        session = LazySession(self._session_pool)
+        data["db_session"] = session
+        try:
             return await handler(event, data)
+        finally:
+            await session.close()
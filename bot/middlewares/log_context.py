@@ -0,0 +1,19 @@
+from typing import Callable, Awaitable, Any, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+
+from logging_setup import log_context
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Tags the records logged while handling an update with the user's ID."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: Message | CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        with log_context(user_id=event.from_user.id if event.from_user else None):
+            return await handler(event, data)
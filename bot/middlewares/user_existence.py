@@ -1,12 +1,62 @@
-from typing import Callable, Awaitable, Dict, Any
+from typing import Callable, Awaitable, Dict, Any, Optional
 
 from aiogram import BaseMiddleware
-from aiogram.types import Message, CallbackQuery
-
+from aiogram.types import Message, CallbackQuery, User as TelegramUser
 from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.utils.cache import LRUCache
+from config_reader import config
 from db import User, KworkSession
 
 
+known_users: LRUCache[bool] = LRUCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+
+
+class UserContext(object):
+    """User of the current update, loaded with its Kwork session at most once.
+
+    A user missing from the database (deleted, or `known_users` is stale) is created again,
+    so handlers always get a user with a Kwork session.
+    """
+    
+    def __init__(self, db_session: AsyncSession, from_user: TelegramUser) -> None:
+        self._db_session = db_session
+        self._from_user = from_user
+        self.user_id = from_user.id
+        self._user: Optional[User] = None
+        
+    async def get(self) -> User:
+        if self._user is None:
+            self._user = await self._db_session.scalar(
+                select(User)
+                .options(selectinload(User.kwork_session))
+                .where(User.id == self.user_id)
+            )
+            if self._user is None:
+                known_users.pop(self.user_id)
+                self._user = await self._create()
+            elif self._user.kwork_session is None:
+                self._user.kwork_session = KworkSession(user_id=self.user_id)
+                await self._db_session.commit()
+        return self._user
+
+    async def _create(self) -> User:
+        user = User(
+            id=self.user_id,
+            username=self._from_user.username,
+            first_name=self._from_user.first_name,
+            last_name=self._from_user.last_name
+        )
+        self._db_session.add(user)
+        kwork_session = KworkSession(user_id=user.id)
+        self._db_session.add(kwork_session)
+        await self._db_session.commit()
+        user.kwork_session = kwork_session
+        return user
+
+
 class CheckUserExistence(BaseMiddleware):
     
     async def __call__(
@@ -15,18 +65,11 @@ class CheckUserExistence(BaseMiddleware):
         event: Message | CallbackQuery,
         data: Dict[str, Any]
     ) -> Any:
-        user = await data["db_session"].scalar(select(User).where(User.id == event.from_user.id))
+        user_id = event.from_user.id
+        user_context = UserContext(data["db_session"], event.from_user)
+        data["user_context"] = user_context
         
-        if not user:
-            user = User(
-                id=event.from_user.id,
-                username=event.from_user.username,
-                first_name=event.from_user.first_name,
-                last_name=event.from_user.last_name
-            )
-            data["db_session"].add(user)
-            kwork_session = KworkSession(user_id=user.id)
-            data["db_session"].add(kwork_session)
-            await data["db_session"].commit()
-            
+        if user_id not in known_users:
+            await user_context.get()
+            known_users.set(user_id, True)
         return await handler(event, data)
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from html import escape
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile, InputMediaDocument, Message
+
+from api import KworkAPI, Project, ProjectFile
+from config_reader import config
+from .cache import LRUCache
+
+
+@dataclass
+class Attachment:
+    url: str
+    filename: str
+    content: Optional[bytes] = None
+    file_id: Optional[str] = None
+
+
+def links_text(attachments: List[Attachment], caption: Optional[str] = None) -> str:
+    links = "\n".join(f"📎 <a href='{attachment.url}'>{escape(attachment.filename)}</a>" for attachment in attachments)
+    return f"{caption}\n\n{links}" if caption else links
+
+
+class AttachmentPipeline(object):
+    """Kwork attachments delivered to Telegram.
+
+    A file is downloaded once (concurrent requests for the same URL share one download) and
+    kept in memory, no temp files are written. Contents are cached up to `content_cache_bytes`
+    in total, files larger than `content_cache_max_file` aren't cached at all: once uploaded,
+    the file_id covers re-sends. After the first upload the Telegram `file_id`
+    is remembered per Kwork file URL, so later deliveries of the same attachment reuse it and
+    don't download or upload the file again.
+
+    Every attachment carries its content or its `file_id`. Kwork files need the user's
+    session, so they are never left for Telegram to fetch by URL: an attachment that has
+    neither (its file_id was evicted before it was pinned) is sent as a link.
+    """
+
+    def __init__(
+        self,
+        max_size: int = config.ATTACHMENT_MAX_SIZE,
+        file_id_cache_size: int = config.ATTACHMENT_FILE_ID_CACHE_SIZE,
+        file_id_ttl: float = config.ATTACHMENT_FILE_ID_TTL,
+        content_cache_size: int = 32,
+        content_ttl: float = 600,
+        content_cache_bytes: int = config.ATTACHMENT_CONTENT_CACHE_BYTES,
+        content_cache_max_file: int = config.ATTACHMENT_CONTENT_CACHE_MAX_FILE
+    ) -> None:
+        self.max_size = max_size
+        self.content_cache_max_file = content_cache_max_file
+        self._file_ids: LRUCache[str] = LRUCache(file_id_cache_size, file_id_ttl)
+        self._contents: LRUCache[bytes] = LRUCache(content_cache_size, content_ttl, content_cache_bytes, len)
+        self._downloads: Dict[str, asyncio.Future] = {}
+        self._uploads: Dict[str, asyncio.Lock] = {}
+
+    async def fetch(self, kwork: KworkAPI, url: str, filename: str) -> Optional[Attachment]:
+        """Prepare an attachment for delivery.
+
+        Args:
+            kwork (KworkAPI): The API client used to download the file.
+            url (str): Kwork file URL.
+            filename (str): File name.
+
+        Returns:
+            Optional[Attachment]: Attachment or None if it can't be downloaded or is too large.
+        """
+        file_id = self._file_ids.get(url)
+        if file_id is not None:
+            return Attachment(url=url, filename=filename, file_id=file_id)
+
+        content = self._contents.get(url)
+        if content is None:
+            content = await self._download(kwork, url)
+        if content is None:
+            return None
+        return Attachment(url=url, filename=filename, content=content)
+
+    async def _download(self, kwork: KworkAPI, url: str) -> Optional[bytes]:
+        future = self._downloads.get(url)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._downloads[url] = future
+        content = None
+        try:
+            content = await kwork.get_file_content(url=url, max_size=self.max_size)
+            if content is None:
+                logging.warning(f"Skipping attachment {url}: download failed or larger than {self.max_size} bytes")
+            elif len(content) <= self.content_cache_max_file:
+                self._contents.set(url, content)
+        except Exception as e:
+            logging.error(f"Failed to download attachment {url}: {e}")
+        finally:
+            future.set_result(content)
+            del self._downloads[url]
+        return content
+
+    async def send(self, bot: Bot, chat_id: int, attachment: Attachment, **kwargs: Any) -> None:
+        """Send the attachment, uploading it only if its `file_id` is unknown.
+
+        Args:
+            bot (Bot): Bot instance.
+            chat_id (int): Telegram chat ID.
+            attachment (Attachment): Attachment to send.
+            **kwargs: Other arguments of `Bot.send_document`.
+        """
+        file_id = attachment.file_id or self._file_ids.get(attachment.url)
+        if file_id is None:
+            lock = self._uploads.setdefault(attachment.url, asyncio.Lock())
+            async with lock:
+                document = self.input_file(attachment)
+                if isinstance(document, BufferedInputFile):
+                    self._remember(attachment, await bot.send_document(chat_id=chat_id, document=document, **kwargs))
+            self._uploads.pop(attachment.url, None)
+
+            if document is None:
+                await self.send_links(bot, chat_id, [attachment], kwargs.get("caption"))
+            if not isinstance(document, str):
+                return
+            file_id = document
+
+        await bot.send_document(chat_id=chat_id, document=file_id, **kwargs)
+
+    async def send_group(self, bot: Bot, chat_id: int, documents: List[Attachment], caption: Optional[str] = None) -> None:
+        """Send 2-10 attachments as one album, uploading only the ones whose `file_id` is unknown.
+
+        Args:
+            bot (Bot): Bot instance.
+            chat_id (int): Telegram chat ID.
+            documents (List[Attachment]): Attachments to send.
+            caption (Optional[str]): Caption of the album, shown under the last document.
+        """
+        urls = sorted({attachment.url for attachment in documents if attachment.file_id is None and attachment.url not in self._file_ids})
+        async with AsyncExitStack() as stack:
+            # Locks are taken in URL order, so albums sharing files can't deadlock.
+            for url in urls:
+                await stack.enter_async_context(self._uploads.setdefault(url, asyncio.Lock()))
+
+            inputs = [(attachment, self.input_file(attachment)) for attachment in documents]
+            missing = [attachment for attachment, document in inputs if document is None]
+            inputs = [(attachment, document) for attachment, document in inputs if document is not None]
+
+            if len(inputs) == 1:
+                attachment, document = inputs[0]
+                self._remember(attachment, await bot.send_document(chat_id=chat_id, document=document, caption=caption))
+            elif inputs:
+                media = [
+                    InputMediaDocument(media=document, caption=caption if index == len(inputs) - 1 else None)
+                    for index, (_, document) in enumerate(inputs)
+                ]
+                messages = await bot.send_media_group(chat_id=chat_id, media=media)
+                for (attachment, _), message in zip(inputs, messages):
+                    self._remember(attachment, message)
+        for url in urls:
+            self._uploads.pop(url, None)
+
+        if missing:
+            await self.send_links(bot, chat_id, missing, caption)
+
+    async def send_links(self, bot: Bot, chat_id: int, attachments: List[Attachment], caption: Optional[str] = None) -> None:
+        """Send links to attachments that can't be sent as files, they open with the user's own Kwork session."""
+        logging.warning(f"Sending {len(attachments)} attachments to chat {chat_id} as links, their file_id is unknown and content isn't kept")
+        await bot.send_message(
+            chat_id=chat_id,
+            text=links_text(attachments, caption),
+            disable_web_page_preview=True
+        )
+
+    def _remember(self, attachment: Attachment, message: Message) -> None:
+        if message.document is not None and attachment.file_id is None and attachment.url not in self._file_ids:
+            self._file_ids.set(attachment.url, message.document.file_id)
+            self._contents.pop(attachment.url)
+
+    def input_file(self, attachment: Attachment) -> Optional[str | BufferedInputFile]:
+        """Get the `file_id` or the content to upload, None if neither is known."""
+        file_id = attachment.file_id or self._file_ids.get(attachment.url)
+        if file_id is not None:
+            return file_id
+        if attachment.content is not None:
+            return BufferedInputFile(attachment.content, filename=attachment.filename)
+        return None
+
+    def pin(self, attachment: Attachment) -> None:
+        """Replace the content of an attachment with its `file_id` if the file was uploaded."""
+        file_id = attachment.file_id or self._file_ids.get(attachment.url)
+        if file_id is not None:
+            attachment.file_id = file_id
+            attachment.content = None
+
+    def file_id(self, url: str) -> Optional[str]:
+        return self._file_ids.get(url)
+
+
+async def fetch_attachments(kwork: KworkAPI, attachments: AttachmentPipeline, projects: List[Project], concurrency: int = config.TICK_CONCURRENCY) -> List[List[Optional[Attachment]]]:
+    """
+    Downloads attachments of all projects in parallel.
+
+    Args:
+        kwork (KworkAPI): The API client used to download attachments.
+        attachments (AttachmentPipeline): Downloader and file_id cache of project attachments.
+        projects (List[Project]): Projects whose files are downloaded.
+        concurrency (int): Maximum number of simultaneous downloads.
+
+    Returns:
+        List[List[Optional[Attachment]]]: Attachments of each project in the original order, None for failed files.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def fetch(file: ProjectFile) -> Optional[Attachment]:
+        async with semaphore:
+            try:
+                return await attachments.fetch(kwork, url=file.url, filename=file.fname)
+            except Exception as e:
+                logging.error(f"Failed to fetch attachment {file.url}: {e}")
+                return None
+    
+    async with asyncio.TaskGroup() as group:
+        tasks = [[group.create_task(fetch(file)) for file in project.files] for project in projects]
+    
+    return [[task.result() for task in project_tasks] for project_tasks in tasks]
@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """Bounded mapping with least-recently-used eviction and per-entry expiry.
+
+    With `weigh` the entries are also bounded by their total weight (e.g. the size of
+    cached bytes): least recently used ones are evicted until it is at most `maxweight`.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        maxweight: Optional[int] = None,
+        weigh: Optional[Callable[[V], int]] = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self._data: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires, value = item
+        if expires < time.monotonic():
+            self.pop(key)
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        self.pop(key)
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._data[key] = (expires, value)
+        if self.weigh is not None:
+            self.weight += self.weigh(value)
+        while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+            self.pop(next(iter(self._data)))
+
+    def pop(self, key: Hashable) -> None:
+        item = self._data.pop(key, None)
+        if item is not None and self.weigh is not None:
+            self.weight -= self.weigh(item[1])
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.weight = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
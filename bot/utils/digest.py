@@ -0,0 +1,210 @@
+"""Coalesced delivery of new projects.
+
+A burst of projects sent one by one costs a Bot API call per project and per attachment and
+eats the per-chat and global rate limits. In the digest mode the projects of a window are
+sent as one compact message with a row of buttons per project, in the auto mode a batch is
+sent as a digest only when the chat can't receive it one by one soon enough (see
+`TelegramSender.budget`), so the threshold follows both the size of the burst and the
+backlog of the sender.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Set, Tuple
+
+from api import KworkAPI, Project
+from db import SeenProjectsStore
+from bot.handlers import localization as loc
+from bot.handlers import keyboards as kb
+from config_reader import config
+from metrics import registry
+from .attachments import Attachment, AttachmentPipeline, fetch_attachments
+from .render import renderer
+from .sender import TelegramSender
+
+
+MEDIA_GROUP_SIZE = 10
+
+DIGEST_MESSAGES = registry.counter("digest_messages_total", "Digest messages queued", ("mode",))
+
+
+@dataclass
+class PendingProject:
+    project: Project
+    documents: List[Attachment]
+
+    @property
+    def sends(self) -> int:
+        """Number of Bot API calls the project costs on its own."""
+        return 1 + -(-len(self.documents) // MEDIA_GROUP_SIZE)
+
+
+def enqueue_documents(sender: TelegramSender, chat_id: int, documents: List[Attachment], caption: str) -> None:
+    """Queue attachments of a project, several of them as albums of up to 10 documents."""
+    for start in range(0, len(documents), MEDIA_GROUP_SIZE):
+        chunk = documents[start:start + MEDIA_GROUP_SIZE]
+        if len(chunk) == 1:
+            sender.enqueue(chat_id, "document", document=chunk[0], caption=caption)
+        else:
+            sender.enqueue(chat_id, "media_group", documents=chunk, caption=caption)
+
+
+def enqueue_project(sender: TelegramSender, chat_id: int, user_id: int, item: PendingProject) -> None:
+    rendered = renderer.render(item.project)
+    enqueue_documents(sender, chat_id, item.documents, rendered.caption)
+    sender.enqueue(
+        chat_id, 
+        "message", 
+        seen=(user_id, [item.project.id]),
+        text=rendered.message(bool(item.documents)), 
+        reply_markup=rendered.keyboard, 
+        disable_web_page_preview=True
+    )
+
+
+def enqueue_digest(sender: TelegramSender, chat_id: int, user_id: int, items: List[PendingProject], mode: str, max_projects: int = config.DIGEST_MAX_PROJECTS) -> None:
+    """Queue the projects as digests of up to `max_projects`, attachments go above them.
+
+    Args:
+        sender (TelegramSender): Outbound delivery queue.
+        chat_id (int): Telegram chat ID.
+        user_id (int): Telegram user ID the projects are marked seen for once delivered.
+        items (List[PendingProject]): Projects with their attachments.
+        mode (str): Delivery mode the digest is sent in, for the metrics.
+        max_projects (int): Projects per digest message.
+    """
+    for start in range(0, len(items), max_projects):
+        chunk = items[start:start + max_projects]
+        if len(chunk) == 1:
+            enqueue_project(sender, chat_id, user_id, chunk[0])
+            continue
+        
+        for item in chunk:
+            enqueue_documents(sender, chat_id, item.documents, renderer.render(item.project).caption)
+        sender.enqueue(
+            chat_id,
+            "message",
+            seen=(user_id, [item.project.id for item in chunk]),
+            text=loc.projects_digest([item.project for item in chunk], [bool(item.documents) for item in chunk]),
+            reply_markup=kb.digest_keyboard([item.project.id for item in chunk]),
+            disable_web_page_preview=True
+        )
+        DIGEST_MESSAGES.labels(mode).inc()
+
+
+class DigestBuffer(object):
+    """Projects of chats in the digest mode held until their window ends.
+
+    The window of a chat starts with its first pending project, so a digest is sent at most
+    `window` seconds after the oldest project in it was found. Only the projects are held,
+    attachments are fetched when the digest is sent, by then most of them have a cached
+    `file_id` and aren't downloaded at all.
+
+    Held projects are marked seen only once their digest is delivered (the sender persists
+    its queue on shutdown). Until then the buffer and the in-memory seen set skip them, and
+    after a crash they are found as new again on the next poll.
+    """
+
+    def __init__(
+        self,
+        sender: TelegramSender,
+        attachments: AttachmentPipeline,
+        seen_store: SeenProjectsStore,
+        window: float = config.DIGEST_WINDOW,
+        max_projects: int = config.DIGEST_MAX_PROJECTS
+    ) -> None:
+        self.sender = sender
+        self.attachments = attachments
+        self.seen_store = seen_store
+        self.window = window
+        self.max_projects = max_projects
+        self._pending: Dict[int, Tuple[int, List[Tuple[KworkAPI, Project]]]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return sum(len(items) for _, items in self._pending.values())
+
+    def add(self, chat_id: int, user_id: int, kwork: KworkAPI, projects: List[Project]) -> int:
+        """Hold the projects until the chat's window ends.
+
+        Args:
+            chat_id (int): Telegram chat ID.
+            user_id (int): Telegram user ID the projects are marked seen for once delivered.
+            kwork (KworkAPI): The API client used to download attachments.
+            projects (List[Project]): New projects of the chat.
+
+        Returns:
+            int: Number of projects that weren't held yet.
+        """
+        entry = self._pending.get(chat_id)
+        held = {project.id for _, project in entry[1]} if entry is not None else set()
+        projects = [project for project in projects if project.id not in held]
+        if not projects:
+            return 0
+        if entry is None:
+            entry = self._pending[chat_id] = (user_id, [])
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(self.window, self.flush, chat_id)
+        entry[1].extend((kwork, project) for project in projects)
+        return len(projects)
+
+    def flush(self, chat_id: int) -> None:
+        """Send the chat's pending projects without waiting for the window to end."""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        entry = self._pending.pop(chat_id, None)
+        if entry is not None:
+            task = asyncio.create_task(self._send(chat_id, *entry))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, chat_id: int, user_id: int, pending: List[Tuple[KworkAPI, Project]]) -> None:
+        try:
+            clients: Dict[int, Tuple[KworkAPI, List[Project]]] = {}
+            for kwork, project in pending:
+                clients.setdefault(id(kwork), (kwork, []))[1].append(project)
+            
+            documents: Dict[int, List[Attachment]] = {}
+            for kwork, projects in clients.values():
+                for project, files in zip(projects, await fetch_attachments(kwork, self.attachments, projects)):
+                    documents[project.id] = [document for document in files if document is not None]
+            
+            items = [PendingProject(project=project, documents=documents[project.id]) for _, project in pending]
+            self.seen_store.reserve(user_id, [project.id for _, project in pending])
+            enqueue_digest(self.sender, chat_id, user_id, items, "digest", self.max_projects)
+        except Exception as e:
+            logging.error(f"Failed to send digest to chat {chat_id}: {e}")
+
+    async def flush_all(self) -> None:
+        """Send every pending digest and wait until they are queued in the sender."""
+        for chat_id in list(self._pending):
+            self.flush(chat_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+def enqueue_projects(
+    sender: TelegramSender,
+    chat_id: int,
+    user_id: int,
+    items: List[PendingProject],
+    mode: str,
+    horizon: float = config.DIGEST_HORIZON
+) -> None:
+    """Queue new projects of a chat according to its delivery mode.
+
+    Args:
+        sender (TelegramSender): Outbound delivery queue.
+        chat_id (int): Telegram chat ID.
+        user_id (int): Telegram user ID the projects are marked seen for once delivered.
+        items (List[PendingProject]): Projects with their attachments.
+        mode (str): "instant", "digest" or "auto", projects of the digest mode are sent as a digest right away.
+        horizon (float): In the auto mode, a batch the chat can't receive within this many seconds is sent as a digest.
+    """
+    if mode == "digest" or (mode == "auto" and len(items) > 1 and sum(item.sends for item in items) > sender.budget(chat_id, horizon)):
+        enqueue_digest(sender, chat_id, user_id, items, mode)
+    else:
+        for item in items:
+            enqueue_project(sender, chat_id, user_id, item)
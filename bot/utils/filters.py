@@ -0,0 +1,296 @@
+"""Per-user project filters matched against all subscribers at once.
+
+Keywords of every user are compiled into one Aho-Corasick automaton, so the text of a
+project is scanned once no matter how many users and keywords there are. pyahocorasick is
+used when installed, a pure Python automaton otherwise. Keywords match whole words only,
+"бот" is not found in "работа".
+"""
+import bisect
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from api import Project
+from db import ProjectFilter
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+MAX_KEYWORDS = 50
+MIN_KEYWORD_LENGTH = 2
+
+# Names of the filter lines users type, see `parse_filter`.
+FIELD_ALIASES = {
+    "слова": "keywords",
+    "ключевые слова": "keywords",
+    "минус": "negative_keywords",
+    "минус-слова": "negative_keywords",
+    "минус слова": "negative_keywords",
+    "бюджет от": "min_price",
+    "допустимый от": "min_possible_price",
+    "нанято от": "min_hired_percent",
+    "предложений до": "max_kwork_count",
+}
+
+# Filter field, project attribute it limits and whether the limit is a minimum.
+THRESHOLDS = (
+    ("min_price", "price_limit", True),
+    ("min_possible_price", "possible_price_limit", True),
+    ("min_hired_percent", "wants_hired_percent", True),
+    ("max_kwork_count", "kwork_count", False),
+)
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def is_whole_word(text: str, start: int, end: int) -> bool:
+    """Check that `text[start:end]` isn't a part of a longer word."""
+    return (
+        (start == 0 or not text[start - 1].isalnum() or not text[start].isalnum())
+        and (end == len(text) or not text[end].isalnum() or not text[end - 1].isalnum())
+    )
+
+
+def contains_word(text: str, word: str) -> bool:
+    start = text.find(word)
+    while start != -1:
+        if is_whole_word(text, start, start + len(word)):
+            return True
+        start = text.find(word, start + 1)
+    return False
+
+
+def split_keywords(value: Optional[str]) -> Tuple[str, ...]:
+    if not value:
+        return ()
+    keywords = (normalize(word.strip()) for word in value.replace("\n", ",").split(","))
+    return tuple(dict.fromkeys(word for word in keywords if word))
+
+
+@dataclass(frozen=True, slots=True)
+class UserFilter:
+    keywords: Tuple[str, ...] = ()
+    negative_keywords: Tuple[str, ...] = ()
+    min_price: Optional[int] = None
+    min_possible_price: Optional[int] = None
+    min_hired_percent: Optional[int] = None
+    max_kwork_count: Optional[int] = None
+
+    @property
+    def empty(self) -> bool:
+        return self == UserFilter()
+
+    @classmethod
+    def from_row(cls, row: ProjectFilter) -> "UserFilter":
+        return cls(
+            keywords=split_keywords(row.keywords),
+            negative_keywords=split_keywords(row.negative_keywords),
+            min_price=row.min_price,
+            min_possible_price=row.min_possible_price,
+            min_hired_percent=row.min_hired_percent,
+            max_kwork_count=row.max_kwork_count
+        )
+
+    def to_row(self, user_id: int) -> ProjectFilter:
+        return ProjectFilter(
+            user_id=user_id,
+            keywords=", ".join(self.keywords) or None,
+            negative_keywords=", ".join(self.negative_keywords) or None,
+            min_price=self.min_price,
+            min_possible_price=self.min_possible_price,
+            min_hired_percent=self.min_hired_percent,
+            max_kwork_count=self.max_kwork_count
+        )
+
+    def accepts(self, project: Project) -> bool:
+        """Check one project, the reference behaviour of `FilterIndex`."""
+        text = normalize(f"{project.name}\n{project.description}")
+        if self.keywords and not any(contains_word(text, word) for word in self.keywords):
+            return False
+        if any(contains_word(text, word) for word in self.negative_keywords):
+            return False
+        if self.min_price is not None and project.price_limit < self.min_price:
+            return False
+        if self.min_possible_price is not None and project.possible_price_limit < self.min_possible_price:
+            return False
+        if self.min_hired_percent is not None and project.wants_hired_percent < self.min_hired_percent:
+            return False
+        if self.max_kwork_count is not None and project.kwork_count > self.max_kwork_count:
+            return False
+        return True
+
+
+def parse_filter(text: str) -> UserFilter:
+    """Parse the filter typed by the user, one `name: value` per line.
+
+    Args:
+        text (str): E.g. "слова: парсер, telegram бот\\nбюджет от: 5000".
+
+    Raises:
+        ValueError: With the line that can't be parsed.
+
+    Returns:
+        UserFilter: Filter, lines that aren't given are unset.
+    """
+    values = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        name, separator, value = line.partition(":")
+        field = FIELD_ALIASES.get(" ".join(normalize(name).split()))
+        if not separator or field is None:
+            raise ValueError(line)
+
+        if field in ("keywords", "negative_keywords"):
+            keywords = split_keywords(value)
+            if len(keywords) > MAX_KEYWORDS or any(len(word) < MIN_KEYWORD_LENGTH for word in keywords):
+                raise ValueError(line)
+            values[field] = keywords
+        else:
+            number = value.strip().rstrip("%₽").replace(" ", "")
+            if not number:
+                values[field] = None
+            elif not number.isdigit() or (field == "min_hired_percent" and int(number) > 100):
+                raise ValueError(line)
+            else:
+                values[field] = int(number)
+    return UserFilter(**values)
+
+
+class Automaton(object):
+    """Aho-Corasick automaton finding which of the words occur in a text as whole words."""
+
+    def __init__(self, words: Sequence[str]) -> None:
+        self._lengths = [len(word) for word in words]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for word_id, word in enumerate(words):
+            state = 0
+            for char in word:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (word_id,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def search(self, text: str) -> Set[int]:
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        found: Set[int] = set()
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for word_id in out[state]:
+                if word_id not in found and is_whole_word(text, end - lengths[word_id], end):
+                    found.add(word_id)
+        return found
+
+
+class NativeAutomaton(object):
+    """`Automaton` backed by pyahocorasick."""
+
+    def __init__(self, words: Sequence[str]) -> None:
+        self._automaton = ahocorasick.Automaton()
+        for word_id, word in enumerate(words):
+            self._automaton.add_word(word, (word_id, len(word)))
+        if words:
+            self._automaton.make_automaton()
+        self._empty = not words
+
+    def search(self, text: str) -> Set[int]:
+        if self._empty:
+            return set()
+        return {
+            word_id
+            for last, (word_id, length) in self._automaton.iter(text)
+            if is_whole_word(text, last + 1 - length, last + 1)
+        }
+
+
+class Threshold(object):
+    """Users sorted by a numeric limit, the ones a value violates are a slice."""
+
+    def __init__(self, limits: Iterable[Tuple[int, int]], minimum: bool) -> None:
+        pairs = sorted(limits)
+        self.limits = [limit for limit, _ in pairs]
+        self.users = [user_id for _, user_id in pairs]
+        self.minimum = minimum
+
+    def violated(self, value: float) -> List[int]:
+        if self.minimum:
+            return self.users[bisect.bisect_right(self.limits, value):]
+        return self.users[:bisect.bisect_left(self.limits, value)]
+
+
+class FilterIndex(object):
+    """All users' filters compiled for matching a project against everybody in one pass.
+
+    Keywords of all users are one automaton with an inverted index from a keyword to the
+    users that want or exclude it, numeric limits are sorted lists where the users a project
+    violates form a contiguous slice. `rejected()` costs one scan of the project's text plus
+    the size of the result, not the number of users.
+    """
+
+    def __init__(self, filters: Dict[int, UserFilter]) -> None:
+        words: Dict[str, int] = {}
+        self._wanted: List[Set[int]] = []
+        self._excluded: List[Set[int]] = []
+        self._keyword_users: Set[int] = set()
+
+        for user_id, user_filter in filters.items():
+            if user_filter.keywords:
+                self._keyword_users.add(user_id)
+            for keywords, index in ((user_filter.keywords, self._wanted), (user_filter.negative_keywords, self._excluded)):
+                for word in keywords:
+                    word_id = words.get(word)
+                    if word_id is None:
+                        word_id = words[word] = len(words)
+                        self._wanted.append(set())
+                        self._excluded.append(set())
+                    index[word_id].add(user_id)
+
+        self._automaton = (NativeAutomaton if ahocorasick is not None else Automaton)(list(words))
+        self._thresholds: List[Tuple[str, Threshold]] = []
+        for field, attribute, minimum in THRESHOLDS:
+            limits = [(getattr(user_filter, field), user_id) for user_id, user_filter in filters.items() if getattr(user_filter, field) is not None]
+            if limits:
+                self._thresholds.append((attribute, Threshold(limits, minimum)))
+        self.size = len(filters)
+
+    def rejected(self, project: Project) -> Set[int]:
+        """Get the users whose filters reject the project."""
+        rejected: Set[int] = set()
+        if self._wanted:
+            found = self._automaton.search(normalize(f"{project.name}\n{project.description}"))
+            accepted: Set[int] = set()
+            for word_id in found:
+                accepted |= self._wanted[word_id]
+                rejected |= self._excluded[word_id]
+            rejected |= self._keyword_users - accepted
+        for attribute, threshold in self._thresholds:
+            rejected.update(threshold.violated(getattr(project, attribute)))
+        return rejected
+
@@ -0,0 +1,130 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config_reader import config
+from cryptographer import encrypt_async, decrypt_async
+from db import FSMRecord
+from .cache import LRUCache
+
+
+Record = Tuple[Optional[str], Dict[str, Any]]
+EMPTY: Record = (None, {})
+
+
+class DBStorage(BaseStorage):
+    """FSM storage in the `fsm_records` table.
+
+    Data is encrypted like the other credentials (the auth flow keeps the login there).
+    States not updated for `ttl` seconds are treated as empty and deleted by `cleanup` in one
+    statement. Decrypted records, missing rows included, are cached in process for
+    `cache_ttl` seconds and replaced on every write, so reading the state of an active chat
+    costs no query. Only the frontend handles updates, but with `ROLE` other than "all" the
+    cache lives `FSM_CLUSTER_CACHE_TTL` so a state written by another process isn't served for
+    long.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        ttl: float = config.FSM_TTL,
+        cache_size: int = config.FSM_CACHE_SIZE,
+        cache_ttl: float = config.FSM_CACHE_TTL if config.ROLE == "all" else config.FSM_CLUSTER_CACHE_TTL
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.ttl = timedelta(seconds=ttl)
+        self._cache: LRUCache[Tuple[Optional[datetime], Record]] = LRUCache(cache_size, min(cache_ttl, ttl))
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    def _cached(self, key: str) -> Optional[Record]:
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        updated_at, record = cached
+        if updated_at is not None and updated_at < datetime.now() - self.ttl:
+            return EMPTY
+        return record
+
+    async def _load(self, key: str) -> Record:
+        record = self._cached(key)
+        if record is not None:
+            return record
+
+        async with self.sessionmaker() as db_session:
+            row = await db_session.get(FSMRecord, key)
+
+        record, updated_at = EMPTY, None
+        if row is not None and row.updated_at >= datetime.now() - self.ttl:
+            data = await decrypt_async(row.data) if row.data else "{}"
+            if data is not None:
+                record, updated_at = (row.state, json.loads(data)), row.updated_at
+        self._cache.set(key, (updated_at, record))
+        return record
+
+    async def _write(self, key: str, **values: Any) -> None:
+        """Update the given columns of the row, inserting it when there is none."""
+        values["updated_at"] = datetime.now()
+        async with self.sessionmaker() as db_session:
+            result = await db_session.execute(update(FSMRecord).where(FSMRecord.key == key).values(**values))
+            if not result.rowcount:
+                db_session.add(FSMRecord(key=key, **values))
+            await db_session.commit()
+
+    async def _save(self, key: str, state: Optional[str], data: Dict[str, Any]) -> None:
+        if state is None and not data:
+            async with self.sessionmaker() as db_session:
+                await db_session.execute(delete(FSMRecord).where(FSMRecord.key == key))
+                await db_session.commit()
+            self._cache.set(key, (None, EMPTY))
+            return
+
+        await self._write(key, state=state, data=await encrypt_async(json.dumps(data)) if data else None)
+        self._cache.set(key, (datetime.now(), (state, dict(data))))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key(key)
+        state = state.state if isinstance(state, State) else state
+        record = self._cached(storage_key)
+        if record is not None:
+            await self._save(storage_key, state, record[1])
+        else:
+            await self._write(storage_key, state=state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        record = self._cached(storage_key)
+        if record is not None:
+            await self._save(storage_key, record[0], data)
+        else:
+            await self._write(storage_key, data=await encrypt_async(json.dumps(data)) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return dict(data)
+
+    async def cleanup(self) -> None:
+        """Delete states that weren't updated for `ttl`."""
+        border = datetime.now() - self.ttl
+        async with self.sessionmaker() as db_session:
+            result = await db_session.execute(delete(FSMRecord).where(FSMRecord.updated_at < border))
+            await db_session.commit()
+        if result.rowcount:
+            logging.info(f"Removed {result.rowcount} expired FSM states")
+
+    async def close(self) -> None:
+        self._cache.clear()
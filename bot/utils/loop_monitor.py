@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from config_reader import config
+from metrics import registry
+
+
+LOOP_LAG = registry.histogram(
+    "event_loop_lag_seconds", "Delay of event loop wake-ups",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+@dataclass
+class LoopLagStats:
+    samples: int = 0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    total_lag: float = 0.0
+
+    @property
+    def avg_lag(self) -> float:
+        return self.total_lag / self.samples if self.samples else 0.0
+
+
+class LoopLagMonitor(object):
+    """Measures how late the event loop wakes up a task sleeping for `interval`.
+
+    The lag is the time the loop spent running other callbacks, e.g. CPU-bound work that
+    should have been offloaded, so handlers waited for at least that long too.
+    """
+
+    def __init__(self, interval: float = config.LOOP_LAG_INTERVAL, warning: float = config.LOOP_LAG_WARNING) -> None:
+        self.interval = interval
+        self.warning = warning
+        self.stats = LoopLagStats()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        logging.info(f"Event loop lag: avg {self.stats.avg_lag * 1000:.1f}ms, max {self.stats.max_lag * 1000:.1f}ms over {self.stats.samples} samples")
+
+    def record(self, lag: float) -> None:
+        self.stats.samples += 1
+        self.stats.last_lag = lag
+        self.stats.max_lag = max(self.stats.max_lag, lag)
+        self.stats.total_lag += lag
+        LOOP_LAG.observe(lag)
+        if lag > self.warning:
+            logging.warning(f"Event loop lag {lag * 1000:.0f}ms")
+
+    async def _loop(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, time.monotonic() - started - self.interval))
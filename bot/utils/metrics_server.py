@@ -0,0 +1,82 @@
+import logging
+from typing import Optional
+
+from aiohttp import web
+
+from config_reader import config
+from metrics import Registry, registry
+from .profiler import SamplingProfiler, profiler
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer(object):
+    """HTTP endpoint with the process metrics and the sampling profiler switch.
+
+    - `GET /metrics`: metrics in the Prometheus text format.
+    - `POST /profile/start?interval=0.005`: start sampling the event loop thread.
+    - `POST /profile/stop`: stop sampling, the samples are kept.
+    - `GET /profile?limit=100`: folded stacks collected so far.
+
+    It listens on its own port, by default on localhost only, so it's never exposed together
+    with the webhook.
+    """
+
+    def __init__(
+        self,
+        host: str = config.METRICS_HOST,
+        port: Optional[int] = config.METRICS_PORT,
+        metrics: Registry = registry,
+        sampler: SamplingProfiler = profiler
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self.sampler = sampler
+        self._runner: Optional[web.AppRunner] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.router.add_post("/profile/start", self.handle_profile_start)
+        app.router.add_post("/profile/stop", self.handle_profile_stop)
+        app.router.add_get("/profile", self.handle_profile)
+        return app
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.metrics.render().encode(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+    async def handle_profile_start(self, request: web.Request) -> web.Response:
+        try:
+            interval = float(request.query["interval"]) if "interval" in request.query else None
+        except ValueError:
+            return web.Response(status=400, text="interval must be a number of seconds")
+        if interval is not None and interval <= 0:
+            return web.Response(status=400, text="interval must be positive")
+        self.sampler.start(interval)
+        return web.Response(text=f"Profiling every {self.sampler.interval}s\n")
+
+    async def handle_profile_stop(self, request: web.Request) -> web.Response:
+        self.sampler.stop()
+        return web.Response(text=f"Stopped, {sum(self.sampler.samples.values())} samples\n")
+
+    async def handle_profile(self, request: web.Request) -> web.Response:
+        limit = request.query.get("limit")
+        if limit is not None and not limit.isdigit():
+            return web.Response(status=400, text="limit must be a positive integer")
+        return web.Response(text=self.sampler.folded(int(limit) if limit else None))
+
+    async def start(self) -> None:
+        if self.port is None or self._runner is not None:
+            return
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.host, port=self.port).start()
+        logging.info(f"Metrics are served on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        self.sampler.stop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,450 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Awaitable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from api import KworkAPI, HttpPool, FeedState, KworkSessionManager, Project
+from bot.utils import scheduler_func
+from bot.utils.sender import PRIORITY_HIGH, TelegramSender
+from bot.utils.attachments import AttachmentPipeline
+from bot.utils.filters import FilterIndex, UserFilter
+from bot.utils.digest import DigestBuffer
+from bot.utils.tick_scheduler import phase_of
+from bot.handlers import localization as loc, keyboards as kb
+from db import KworkSession, SeenProjectsStore, _sessionmaker, load_trackers, load_filters, load_delivery_modes, disable_tracking
+from config_reader import config
+from cryptographer import decrypt_cookie, invalidate_cookie
+from logging_setup import log_context
+from metrics import registry
+
+
+TICK_SECONDS = registry.histogram("poller_tick_seconds", "Duration of a poller tick")
+TICK_REQUESTS = registry.counter("poller_feed_requests_total", "Feed fetches made by the poller")
+TICK_PROJECTS = registry.histogram(
+    "poller_tick_projects", "Projects returned by the fetches of a tick, whole pages for revalidated users",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+SUBSCRIBERS = registry.gauge("poller_subscribers", "Users tracked by this process")
+FEEDS = registry.gauge("poller_feeds", "Distinct feeds polled by this process")
+
+
+@dataclass
+class Subscriber:
+    user_id: int
+    chat_id: int
+    cookie: Optional[bytes]
+
+
+@dataclass
+class Feed:
+    members: Set[int]
+    fingerprint: Optional[str] = None
+    state: FeedState = field(default_factory=FeedState)
+
+
+@dataclass
+class Observation:
+    members: Set[int]
+    projects: List[Project]
+    kwork: KworkAPI
+    state: FeedState
+
+
+def feed_fingerprint(project_ids: List[int]) -> Optional[str]:
+    """Build a fingerprint of the feed page.
+
+    Args:
+        project_ids (List[int]): IDs of projects on the first feed page.
+
+    Returns:
+        Optional[str]: Fingerprint or None for an empty page (empty pages are never merged).
+    """
+    if not project_ids:
+        return None
+    ids = ",".join(str(project_id) for project_id in sorted(project_ids))
+    return hashlib.sha1(ids.encode()).hexdigest()
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    """Get the worker shard that owns the user.
+
+    The key is salted, so shards don't line up with the tick phases of `phase_of`.
+    """
+    return zlib.crc32(f"shard:{user_id}".encode()) % shards
+
+
+class ProjectsPoller(object):
+    """Central polling engine.
+
+    Kwork returns projects by the categories selected in the account, so users with the same
+    selection see the same feed. Subscribers are grouped into feeds by the fingerprint of the
+    page they receive, each feed is fetched once per tick with the cookie of one of its members
+    and the result is fanned out to every member. New subscribers and a rotating slice of known
+    ones are fetched with their own cookie to detect category changes, so the number of
+    requests per interval is about `feeds + subscribers / revalidate_every`.
+    
+    With `TickScheduler` the interval is split into `slots` phases: a feed is polled in the
+    phase of its lowest user ID and a user is revalidated in the phase of its own ID, both by
+    deterministic hashing, so the load is spread evenly instead of arriving once a minute.
+
+    Subscribers hold only ids and the encrypted cookie, the registry itself lives in the
+    `trackers` table and every tick works with its own short-lived database session.
+
+    Trackers can be split between worker processes: a poller owns the users whose
+    `shard_of` is its `shard` and picks up trackers changed by other processes with `sync`.
+    A poller without a shard (the frontend process) owns nobody and never polls.
+    """
+
+    def __init__(self, http_pool: HttpPool, seen_store: SeenProjectsStore, sender: TelegramSender, attachments: AttachmentPipeline, sessions: KworkSessionManager, sessionmaker: async_sessionmaker = _sessionmaker, slots: int = config.TICK_SLOTS, revalidate_every: int = 10, feed_attempts: int = 2, concurrency: int = config.TICK_CONCURRENCY, shard: Optional[int] = 0, shards: int = 1) -> None:
+        self.http_pool = http_pool
+        self.seen_store = seen_store
+        self.sender = sender
+        self.attachments = attachments
+        self.sessions = sessions
+        self.sessionmaker = sessionmaker
+        self.revalidate_every = revalidate_every
+        self.feed_attempts = feed_attempts
+        self.concurrency = concurrency
+        self.shard = shard
+        self.shards = shards
+        self._subscribers: Dict[int, Subscriber] = {}
+        self.slots = slots
+        self._feeds: List[Feed] = []
+        self._unassigned: Set[int] = set()
+        self._regroup_lock = asyncio.Lock()
+        self._rounds: Dict[int, int] = {}
+        self._tick_ids = itertools.count(1)
+        self._filters: Dict[int, UserFilter] = {}
+        self._filter_index: Optional[FilterIndex] = None
+        self._delivery_modes: Dict[int, str] = {}
+        self.digests = DigestBuffer(sender, attachments, seen_store)
+
+    def owns(self, user_id: int) -> bool:
+        return self.shard is not None and shard_of(user_id, self.shards) == self.shard
+
+    def subscribe(self, user_id: int, chat_id: int, cookie: Optional[bytes]) -> None:
+        if not self.owns(user_id):
+            return
+        self.unsubscribe(user_id)
+        self._subscribers[user_id] = Subscriber(user_id=user_id, chat_id=chat_id, cookie=cookie)
+        self._unassigned.add(user_id)
+
+    def unsubscribe(self, user_id: int) -> None:
+        self._subscribers.pop(user_id, None)
+        self.http_pool.forget(user_id)
+        invalidate_cookie(user_id)
+        self.seen_store.forget(user_id)
+        self.sessions.forget(user_id)
+        self._unassigned.discard(user_id)
+        for feed in self._feeds:
+            feed.members.discard(user_id)
+        self._feeds = [feed for feed in self._feeds if feed.members]
+
+    def is_subscribed(self, user_id: int) -> bool:
+        return user_id in self._subscribers
+
+    def set_filter(self, user_id: int, user_filter: Optional[UserFilter]) -> None:
+        """Replace the user's project filter, the index is rebuilt on the next tick."""
+        if not self.owns(user_id):
+            return
+        if user_filter is None or user_filter.empty:
+            if self._filters.pop(user_id, None) is None:
+                return
+        elif self._filters.get(user_id) == user_filter:
+            return
+        else:
+            self._filters[user_id] = user_filter
+        self._filter_index = None
+
+    def delivery_mode(self, user_id: int) -> str:
+        return self._delivery_modes.get(user_id, config.DELIVERY_MODE)
+
+    def set_delivery_mode(self, user_id: int, mode: Optional[str]) -> None:
+        """Replace the user's delivery mode, projects held for a digest are sent when leaving it."""
+        if not self.owns(user_id):
+            return
+        if mode is None:
+            self._delivery_modes.pop(user_id, None)
+        else:
+            self._delivery_modes[user_id] = mode
+        subscriber = self._subscribers.get(user_id)
+        if subscriber is not None and self.delivery_mode(user_id) != "digest":
+            self.digests.flush(subscriber.chat_id)
+
+    @property
+    def filter_index(self) -> FilterIndex:
+        if self._filter_index is None:
+            self._filter_index = FilterIndex(self._filters)
+        return self._filter_index
+
+    async def rehydrate(self) -> None:
+        """Subscribe every tracker of the shard stored in the database."""
+        started = time.perf_counter()
+        subscribed, stale = await self.sync()
+        logging.info(f"Rehydrated {subscribed} trackers ({stale} stale) in {time.perf_counter() - started:.3f}s")
+
+    async def sync(self) -> Tuple[int, int]:
+        """Reconcile subscribers with the trackers of the shard stored in the database.
+
+        New trackers and changed cookies are subscribed, subscribers without a tracker are
+        dropped and project filters and delivery modes of the shard are reloaded. Trackers
+        whose cookie can't be decrypted (the encryption key changed on restart) are removed
+        and their users are asked to enable tracking again.
+
+        Returns:
+            Tuple[int, int]: Number of subscribed and stale trackers.
+        """
+        async with self.sessionmaker() as db_session:
+            trackers = [tracker for tracker in await load_trackers(db_session) if self.owns(tracker[0])]
+            stale = []
+            current = set()
+            
+            for user_id, chat_id, cookie in trackers:
+                subscriber = self._subscribers.get(user_id)
+                if subscriber is not None and subscriber.chat_id == chat_id and subscriber.cookie == cookie:
+                    current.add(user_id)
+                elif decrypt_cookie(user_id, cookie) is None:
+                    stale.append((user_id, chat_id))
+                else:
+                    self.subscribe(user_id, chat_id, cookie)
+                    current.add(user_id)
+            
+            for user_id in set(self._subscribers) - current:
+                self.unsubscribe(user_id)
+            
+            filters = {row.user_id: UserFilter.from_row(row) for row in await load_filters(db_session) if self.owns(row.user_id)}
+            filters = {user_id: user_filter for user_id, user_filter in filters.items() if not user_filter.empty}
+            if filters != self._filters:
+                self._filters = filters
+                self._filter_index = None
+            
+            modes = await load_delivery_modes(db_session)
+            for user_id in set(modes) | set(self._delivery_modes):
+                if self.owns(user_id) and modes.get(user_id) != self._delivery_modes.get(user_id):
+                    self.set_delivery_mode(user_id, modes.get(user_id))
+            
+            if stale:
+                stale_ids = [user_id for user_id, _ in stale]
+                await disable_tracking(db_session, stale_ids)
+                await db_session.execute(update(KworkSession).where(KworkSession.user_id.in_(stale_ids)).values(cookie=None))
+                await db_session.commit()
+                for _, chat_id in stale:
+                    self.sender.enqueue(chat_id, "message", priority=PRIORITY_HIGH, text=loc.projects_tracking_stopped())
+        
+        return len(current), len(stale)
+
+    async def _drop(self, subscriber: Subscriber) -> None:
+        """Stop tracking for a user whose Kwork session can't be restored."""
+        logging.warning(f"Disabling tracking for user_id {subscriber.user_id}: Kwork relogin keeps failing")
+        self.unsubscribe(subscriber.user_id)
+        async with self.sessionmaker() as db_session:
+            await disable_tracking(db_session, [subscriber.user_id])
+            await db_session.commit()
+        self.sender.enqueue(subscriber.chat_id, "message", priority=PRIORITY_HIGH, text=loc.error_auth(), reply_markup=kb.auth_keyboard())
+
+    @property
+    def feeds_count(self) -> int:
+        return len(self._feeds) + len(self._unassigned)
+
+    def _feed_phase(self, feed: Feed) -> int:
+        return phase_of(min(feed.members), self.slots)
+
+    def _rejected(self, observations: List[Observation]) -> Dict[int, Set[int]]:
+        """Match the projects of a tick against the filters of all users.
+
+        Each project is matched once even if it's in several feeds.
+
+        Returns:
+            Dict[int, Set[int]]: IDs of the projects rejected by each user's filter.
+        """
+        index = self.filter_index
+        if not index.size:
+            return {}
+
+        matched: Dict[int, Set[int]] = {}
+        rejected: Dict[int, Set[int]] = defaultdict(set)
+        for observation in observations:
+            for project in observation.projects:
+                users = matched.get(project.id)
+                if users is None:
+                    users = matched[project.id] = index.rejected(project)
+                for user_id in users & observation.members:
+                    rejected[user_id].add(project.id)
+        return rejected
+
+    async def _fetch(self, user_id: int, state: Optional[FeedState] = None) -> Optional[Observation]:
+        subscriber = self._subscribers.get(user_id)
+        if subscriber is None:
+            return None
+
+        with log_context(user_id=user_id):
+            state = state or FeedState()
+            kwork = self.http_pool.kwork(user_id, decrypt_cookie(user_id, subscriber.cookie))
+            success, projects = await kwork.get_projects(state)
+
+            if not success and kwork.session_expired:
+                cookie = await self.sessions.relogin(user_id)
+                if cookie is None:
+                    if self.sessions.failures(user_id) >= self.sessions.max_failures:
+                        await self._drop(subscriber)
+                    return None
+
+                subscriber.cookie = cookie
+                kwork = self.http_pool.kwork(user_id, decrypt_cookie(user_id, cookie))
+                success, projects = await kwork.get_projects(state)
+
+            if not success:
+                return None
+            return Observation(members={user_id}, projects=projects, kwork=kwork, state=state)
+
+    async def _fetch_feed(self, members: Set[int], state: FeedState, rotation: int) -> Optional[Observation]:
+        candidates = sorted(members)
+        start = rotation % len(candidates)
+
+        for i in range(min(self.feed_attempts, len(candidates))):
+            observation = await self._fetch(candidates[(start + i) % len(candidates)], state)
+            if observation is not None:
+                observation.members = set(members)
+                return observation
+
+        logging.error(f"Failed to fetch feed of {len(members)} subscribers")
+        return None
+
+    async def tick(self, slot: Optional[int] = None) -> None:
+        """Fetch the distinct feeds of the slot once and deliver new projects to their subscribers.
+
+        Records logged during the tick carry its ID.
+
+        Args:
+            slot (Optional[int]): Phase slot of `TickScheduler`, every feed is polled if None.
+        """
+        with log_context(tick_id=next(self._tick_ids)):
+            await self._tick(slot)
+
+    async def _tick(self, slot: Optional[int]) -> None:
+        started = time.perf_counter()
+        key = -1 if slot is None else slot
+        rounds = self._rounds[key] = self._rounds.get(key, 0) + 1
+
+        async with self._regroup_lock:
+            due = [feed for feed in self._feeds if slot is None or self._feed_phase(feed) == slot]
+            revalidate = {
+                user_id for user_id in self._subscribers
+                if (slot is None or phase_of(user_id, self.slots) == slot)
+                and (user_id + rounds) % self.revalidate_every == 0
+            } | self._unassigned
+            self._unassigned = set()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(fetch: Awaitable[Optional[Observation]]) -> Optional[Observation]:
+            async with semaphore:
+                try:
+                    return await fetch
+                except Exception as e:
+                    logging.error(f"Feed fetch failed: {e}")
+                    return None
+
+        # Each job remembers the feed it was split from, None for a revalidated user.
+        jobs: List[Tuple[Optional[Feed], Feed]] = []
+        fetches: List[Awaitable[Optional[Observation]]] = []
+        for feed in due:
+            members = feed.members - revalidate
+            if members:
+                jobs.append((feed, Feed(members=members, fingerprint=feed.fingerprint, state=feed.state)))
+                fetches.append(bounded(self._fetch_feed(members, feed.state, rounds)))
+        for user_id in revalidate:
+            jobs.append((None, Feed(members={user_id})))
+            fetches.append(bounded(self._fetch(user_id)))
+
+        results = await asyncio.gather(*fetches)
+
+        observations: List[Observation] = []
+        # Slot runs overlap, so feeds may have changed during the fetches: members are taken
+        # from the current feeds, not from the snapshot the jobs were made of.
+        async with self._regroup_lock:
+            due_ids = {id(feed) for feed in due}
+            current_ids = {id(feed) for feed in self._feeds}
+            kept: List[Feed] = []
+            for feed in self._feeds:
+                if id(feed) in due_ids:
+                    continue
+                feed.members -= revalidate
+                if feed.members:
+                    kept.append(feed)
+            known = {feed.fingerprint: feed for feed in kept if feed.fingerprint is not None}
+
+            groups: Dict[str, Feed] = {}
+            for (source, job), observation in zip(jobs, results):
+                if source is None:
+                    members = job.members & self._subscribers.keys()
+                elif id(source) in current_ids:
+                    members = source.members - revalidate
+                else:
+                    # Another run has already regrouped the feed and its members.
+                    members = set()
+
+                if observation is None:
+                    if members:
+                        kept.append(Feed(members=members, fingerprint=job.fingerprint, state=job.state))
+                    continue
+
+                self.seen_store.buffer.polled(observation.members)
+                if observation.projects:
+                    observations.append(observation)
+                if not members:
+                    continue
+                fingerprint = feed_fingerprint(observation.state.first_page_ids)
+                feed = None
+                if fingerprint is not None:
+                    feed = known.get(fingerprint) or groups.get(fingerprint)
+                if feed is None:
+                    feed = Feed(members=set(), fingerprint=fingerprint, state=observation.state)
+                    kept.append(feed)
+                    if fingerprint is not None:
+                        groups[fingerprint] = feed
+                feed.members |= members
+
+            self._feeds = kept
+
+        rejected = self._rejected(observations)
+
+        async with self.sessionmaker() as db_session:
+            for observation in observations:
+                for user_id in sorted(observation.members):
+                    subscriber = self._subscribers.get(user_id)
+                    if subscriber is None:
+                        continue
+                    with log_context(user_id=user_id):
+                        try:
+                            await scheduler_func.projects_tracking(
+                                user_id=subscriber.user_id,
+                                chat_id=subscriber.chat_id,
+                                db_session=db_session,
+                                projects=observation.projects,
+                                kwork=observation.kwork,
+                                seen_store=self.seen_store,
+                                sender=self.sender,
+                                attachments=self.attachments,
+                                filtered=rejected.get(user_id),
+                                mode=self.delivery_mode(user_id),
+                                digests=self.digests
+                            )
+                        except Exception as e:
+                            logging.error(f"Projects tracking failed for user_id {user_id}: {e}")
+                            await db_session.rollback()
+
+        TICK_SECONDS.observe(time.perf_counter() - started)
+        TICK_REQUESTS.inc(len(fetches))
+        TICK_PROJECTS.observe(sum(len(observation.projects) for observation in observations))
+        SUBSCRIBERS.set(len(self._subscribers))
+        FEEDS.set(self.feeds_count)
+        logging.info(f"Poller slot {slot}: {len(fetches)} requests, {len(self._subscribers)} subscribers, {self.feeds_count} feeds")
@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+
+from aiogram.types import InlineKeyboardMarkup
+
+from api import Project
+from bot.handlers import localization as loc
+from bot.handlers import keyboards as kb
+from config_reader import config
+from .cache import LRUCache
+
+
+@dataclass(frozen=True)
+class RenderedProject:
+    text: str
+    caption: str
+    keyboard: InlineKeyboardMarkup
+
+    def message(self, attachment: bool) -> str:
+        return self.text + loc.attachment_note() if attachment else self.text
+
+
+def content_hash(project: Project) -> int:
+    """Hash of the project fields shown in the message."""
+    return hash((
+        project.name, project.description, project.price_limit, project.possible_price_limit,
+        project.profile_url, project.active_wants, project.time_left, project.kwork_count,
+        project.wants_count, project.wants_hired_percent
+    ))
+
+
+class ProjectRenderer(object):
+    """Project messages shared by all recipients.
+
+    The text, the attachment caption and the keyboard of a project are built once per
+    project id and content hash, so a project delivered to many subscribers is rendered once
+    and rendered again only when the fields shown in the message change.
+    """
+
+    def __init__(self, maxsize: int = config.RENDER_CACHE_SIZE, ttl: float = config.RENDER_CACHE_TTL) -> None:
+        self._cache: LRUCache[tuple[int, RenderedProject]] = LRUCache(maxsize, ttl)
+
+    def render(self, project: Project) -> RenderedProject:
+        project_id = project.id
+        digest = content_hash(project)
+
+        cached = self._cache.get(project_id)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+
+        rendered = RenderedProject(
+            text=loc.project_info(project, attachment=False),
+            caption=loc.remove_emojis(project.name),
+            keyboard=kb.project_keyboard(project_id=project_id)
+        )
+        self._cache.set(project_id, (digest, rendered))
+        return rendered
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+renderer = ProjectRenderer()
@@ -1,64 +1,61 @@
-import os
-import json
+from typing import List, Optional, Set
 
-import aiofiles
-from aiogram.types import Message, FSInputFile
-from aiohttp import ClientSession
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api import KworkAPI
-from bot.handlers import localization as loc
-from bot.handlers import keyboards as kb
-from db.models import User
-from cryptographer import decrypt
+from api import KworkAPI, Project
+from db import SeenProjectsStore
+from .sender import TelegramSender
+from .attachments import AttachmentPipeline, fetch_attachments
+from .digest import DigestBuffer, PendingProject, enqueue_projects
+from metrics import registry
+
+
+TRACKING_SECONDS = registry.histogram("projects_tracking_seconds", "Duration of projects_tracking per user")
+QUEUED_PROJECTS = registry.counter("projects_queued_total", "New projects queued for delivery to users")
+FILTERED_PROJECTS = registry.counter("projects_filtered_total", "New projects rejected by users' filters")
             
             
-async def projects_tracking(user: User, message: Message, db_session: AsyncSession) -> None:
+@TRACKING_SECONDS.timed
+async def projects_tracking(user_id: int, chat_id: int, db_session: AsyncSession, projects: List[Project], kwork: KworkAPI, seen_store: SeenProjectsStore, sender: TelegramSender, attachments: AttachmentPipeline, filtered: Optional[Set[int]] = None, mode: str = "instant", digests: Optional[DigestBuffer] = None) -> None:
     """
-    Tracks new projects for the user on Kwork and sends information about them to the chat.
+    Queues information about new projects of the feed for delivery to the user's chat.
 
     Args:
-        user (User): The user object for whom the project tracking is performed.
-        message (Message): The message object used to send information to the user.
+        user_id (int): Telegram user ID for whom the project tracking is performed.
+        chat_id (int): Telegram chat ID that receives the projects.
         db_session (AsyncSession): The asynchronous session for database operations.
+        projects (List[Project]): Projects of the user's feed fetched by the poller.
+        kwork (KworkAPI): The API client used to download attachments.
+        seen_store (SeenProjectsStore): Store of projects already sent to users.
+        sender (TelegramSender): Outbound delivery queue.
+        attachments (AttachmentPipeline): Downloader and file_id cache of project attachments.
+        filtered (Optional[Set[int]]): IDs of projects rejected by the user's filter, they are marked as seen without being sent.
+        mode (str): Delivery mode of the user, see `enqueue_projects`.
+        digests (Optional[DigestBuffer]): Buffer holding the projects of the digest mode, their attachments are fetched when the digest is sent.
 
     Returns:
         None
     """
-    async with ClientSession() as session:
-        kwork = KworkAPI(session)
-        kwork.headers["Cookie"] = decrypt(user.kwork_session.cookie)
-        success, projects = await kwork.get_projects()
-        
-        if not success:
-            return
+    await seen_store.load(db_session, user_id)
+    new_projects = [project for project in projects if seen_store.is_new(user_id, project.id)]
+    if filtered:
+        rejected = [project.id for project in new_projects if project.id in filtered]
+        new_projects = [project for project in new_projects if project.id not in filtered]
+        seen_store.mark_seen(user_id, rejected)
+        FILTERED_PROJECTS.inc(len(rejected))
+    
+    # Projects are written as seen only once the sender delivers them, so a crash with a
+    # full queue delivers them again instead of losing them.
+    if mode == "digest" and digests is not None:
+        queued = digests.add(chat_id, user_id, kwork, new_projects)
+    else:
+        queued = len(new_projects)
+        seen_store.reserve(user_id, [project.id for project in new_projects])
+        files = await fetch_attachments(kwork, attachments, new_projects)
+        items = [
+            PendingProject(project=project, documents=[document for document in documents if document is not None])
+            for project, documents in zip(new_projects, files)
+        ]
+        enqueue_projects(sender, chat_id, user_id, items, mode)
         
-        projects_ids = []
-        
-        for project in projects:
-            attachment = False
-            projects_ids.append(project.get("id"))
-            
-            if project.get("id") not in json.loads(user.kwork_session.last_projects):
-                for file in project.get("files"):
-                    content = await kwork.get_file_content(url=file["url"])
-                    filepath = f"temp/{file['fname']}"
-                    
-                    async with aiofiles.open(filepath, "wb") as file:
-                        await file.write(content)
-                    
-                    await message.answer_document(
-                        document=FSInputFile(filepath),
-                        caption=loc.remove_emojis(project['name'])
-                    )
-                    os.remove(filepath)
-                    attachment = True
-                    
-                await message.answer(
-                    text=loc.project_info(project, attachment), 
-                    reply_markup=kb.project_keyboard(project_id=project["id"]), 
-                    disable_web_page_preview=True
-                )
-                
-        user.kwork_session.last_projects = json.dumps(projects_ids)
-        await db_session.commit()
+    QUEUED_PROJECTS.inc(queued)
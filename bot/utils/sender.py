@@ -0,0 +1,361 @@
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNotFound
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config_reader import config
+from db import PendingDelivery
+from metrics import registry
+from .attachments import Attachment, AttachmentPipeline
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+
+SEND_SECONDS = registry.histogram("telegram_send_seconds", "Duration of successful Bot API sends", ("method",))
+SEND_RETRIES = registry.counter("telegram_send_retries_total", "Deliveries postponed for a retry", ("reason",))
+SEND_DROPPED = registry.counter("telegram_send_dropped_total", "Deliveries dropped without being sent", ("reason",))
+SEND_QUEUE = registry.gauge("telegram_send_queue", "Deliveries waiting in the sender lanes")
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self) -> float:
+        """Get the time to wait until a token is available."""
+        now = time.monotonic()
+        if now < self.updated:
+            return self.updated - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def available(self) -> float:
+        """Get the tokens available now, negative while paused."""
+        now = time.monotonic()
+        if now < self.updated:
+            return self.tokens - (self.updated - now) * self.rate
+        return min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    async def acquire(self) -> None:
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+        self.consume()
+
+    def pause(self, seconds: float) -> None:
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+def dump_attachment(attachment: Attachment) -> Dict[str, str]:
+    dumped = {"url": attachment.url, "filename": attachment.filename}
+    if attachment.file_id is not None:
+        dumped["file_id"] = attachment.file_id
+    elif attachment.content is not None:
+        dumped["data"] = base64.b64encode(attachment.content).decode()
+    return dumped
+
+
+def load_attachment(dumped: Dict[str, str]) -> Attachment:
+    content = base64.b64decode(dumped["data"]) if "data" in dumped else None
+    return Attachment(url=dumped["url"], filename=dumped["filename"], content=content, file_id=dumped.get("file_id"))
+
+
+@dataclass
+class Delivery:
+    chat_id: int
+    method: str
+    payload: Dict[str, Any]
+    priority: int = PRIORITY_NORMAL
+    attempts: int = 0
+    seen: Optional[Tuple[int, List[int]]] = None
+
+    def dump_payload(self) -> str:
+        payload = dict(self.payload)
+        if isinstance(payload.get("reply_markup"), InlineKeyboardMarkup):
+            payload["reply_markup"] = payload["reply_markup"].model_dump(mode="json", exclude_none=True)
+        if isinstance(payload.get("documents"), list):
+            payload["documents"] = [dump_attachment(document) for document in payload["documents"]]
+        if isinstance(payload.get("document"), Attachment):
+            payload["document"] = dump_attachment(payload["document"])
+        elif isinstance(payload.get("document"), BufferedInputFile):
+            document = payload["document"]
+            payload["document"] = {"filename": document.filename, "data": base64.b64encode(document.data).decode()}
+        return json.dumps(payload)
+
+    @classmethod
+    def load(cls, row: PendingDelivery) -> "Delivery":
+        payload = json.loads(row.payload)
+        if isinstance(payload.get("reply_markup"), dict):
+            payload["reply_markup"] = InlineKeyboardMarkup.model_validate(payload["reply_markup"])
+        if isinstance(payload.get("documents"), list):
+            payload["documents"] = [load_attachment(document) for document in payload["documents"]]
+        if isinstance(payload.get("document"), dict):
+            document = payload["document"]
+            if "url" in document:
+                payload["document"] = load_attachment(document)
+            else:
+                payload["document"] = BufferedInputFile(base64.b64decode(document["data"]), filename=document["filename"])
+        return cls(chat_id=row.chat_id, method=row.method, payload=payload, priority=row.priority)
+
+
+class TelegramSender(object):
+    """Outbound delivery queue.
+
+    Deliveries are kept in a lane per chat, so messages of one priority reach a chat in the
+    order they were enqueued while higher priority ones (notices about tracking) overtake
+    them, and lanes are served by a pool of workers in priority order. Sends are limited by a
+    global and a per-chat token bucket, `TelegramRetryAfter` pauses the chat for `retry_after`
+    seconds and deliveries left on shutdown are persisted and restored on the next start.
+
+    A delivery may carry the projects it announces, `on_seen` gets them once it leaves the
+    queue (sent, dropped or persisted), so projects of a queue lost in a crash aren't
+    recorded as seen and are delivered again.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        attachments: AttachmentPipeline,
+        workers: int = config.SEND_WORKERS,
+        global_rate: float = config.SEND_GLOBAL_RATE,
+        chat_rate: float = config.SEND_CHAT_RATE,
+        chat_burst: float = config.SEND_CHAT_BURST,
+        max_attempts: int = 5,
+        on_delivered: Optional[Callable[[int], None]] = None,
+        on_seen: Optional[Callable[[int, List[int]], None]] = None
+    ) -> None:
+        self.bot = bot
+        self.on_delivered = on_delivered
+        self.on_seen = on_seen
+        self.attachments = attachments
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._lanes: Dict[int, Deque[Delivery]] = {}
+        self._ready: asyncio.PriorityQueue[Tuple[int, int, int]] = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        SEND_QUEUE.set_function(lambda: self.pending)
+
+    @property
+    def pending(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def enqueue(self, chat_id: int, method: str, priority: int = PRIORITY_NORMAL, seen: Optional[Tuple[int, List[int]]] = None, **payload: Any) -> None:
+        """Put a delivery into the chat's lane without waiting for it to be sent.
+
+        Args:
+            chat_id (int): Telegram chat ID.
+            method (str): "message", "document" or "media_group".
+            priority (int): Lower is sent first.
+            seen (Optional[Tuple[int, List[int]]]): User ID and the projects passed to `on_seen` once the delivery leaves the queue.
+            **payload: Arguments of `Bot.send_message` / `Bot.send_document`, `documents` and `caption` of an album.
+        """
+        self._push(Delivery(chat_id=chat_id, method=method, payload=payload, priority=priority, seen=seen))
+
+    def budget(self, chat_id: int, horizon: float) -> float:
+        """Estimate how many more sends the chat can get within `horizon` seconds without queueing.
+
+        It's the chat's token bucket minus the deliveries already waiting in its lane, scaled
+        down by how much longer than `horizon` the whole queue takes to drain at the global rate.
+        """
+        bucket = self._chat_buckets.get(chat_id)
+        tokens = bucket.available() if bucket is not None else self.chat_burst
+        budget = tokens + self.chat_rate * horizon - len(self._lanes.get(chat_id, ()))
+        drain = self.pending / self._global.rate
+        if drain > horizon:
+            budget *= horizon / drain
+        return max(budget, 0.0)
+
+    def _push(self, delivery: Delivery) -> None:
+        lane = self._lanes.get(delivery.chat_id)
+        if lane is None:
+            self._lanes[delivery.chat_id] = deque([delivery])
+            self._schedule(delivery.chat_id)
+            return
+        # A delivery overtakes queued ones of lower priority, but never the head, which may
+        # be in flight.
+        index = len(lane)
+        while index > 1 and lane[index - 1].priority > delivery.priority:
+            index -= 1
+        lane.insert(index, delivery)
+
+    def _schedule(self, chat_id: int, delay: float = 0) -> None:
+        item = (self._lanes[chat_id][0].priority, next(self._seq), chat_id)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, item)
+        else:
+            self._ready.put_nowait(item)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _send(self, delivery: Delivery) -> None:
+        if delivery.method == "message":
+            await self.bot.send_message(chat_id=delivery.chat_id, **delivery.payload)
+        elif delivery.method == "document" and isinstance(delivery.payload.get("document"), Attachment):
+            payload = dict(delivery.payload)
+            await self.attachments.send(self.bot, delivery.chat_id, payload.pop("document"), **payload)
+        elif delivery.method == "document":
+            await self.bot.send_document(chat_id=delivery.chat_id, **delivery.payload)
+        elif delivery.method == "media_group":
+            await self.attachments.send_group(self.bot, delivery.chat_id, **delivery.payload)
+        else:
+            raise ValueError(f"Unknown delivery method: {delivery.method}")
+
+    def _pop(self, lane: Deque[Delivery]) -> None:
+        delivery = lane.popleft()
+        if delivery.seen is not None and self.on_seen is not None:
+            self.on_seen(*delivery.seen)
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, chat_id = await self._ready.get()
+            lane = self._lanes.get(chat_id)
+            if not lane:
+                self._lanes.pop(chat_id, None)
+                continue
+
+            bucket = self._chat_bucket(chat_id)
+            if (delay := bucket.delay()) > 0:
+                self._schedule(chat_id, delay)
+                continue
+
+            await self._global.acquire()
+            bucket.consume()
+
+            delivery = lane[0]
+            retry = 0.0
+            started = time.perf_counter()
+            try:
+                await self._send(delivery)
+                SEND_SECONDS.labels(delivery.method).observe(time.perf_counter() - started)
+                self._pop(lane)
+                if self.on_delivered is not None:
+                    self.on_delivered(chat_id)
+            except TelegramRetryAfter as e:
+                logging.warning(f"Flood control for chat {chat_id}, retry after {e.retry_after}s")
+                SEND_RETRIES.labels("flood_control").inc()
+                bucket.pause(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound) as e:
+                logging.error(f"Dropping delivery to chat {chat_id}: {e}")
+                SEND_DROPPED.labels("rejected").inc()
+                self._pop(lane)
+            except Exception as e:
+                delivery.attempts += 1
+                if delivery.attempts >= self.max_attempts:
+                    logging.error(f"Dropping delivery to chat {chat_id} after {delivery.attempts} attempts: {e}")
+                    SEND_DROPPED.labels("attempts").inc()
+                    self._pop(lane)
+                else:
+                    retry = min(2 ** delivery.attempts, 60)
+                    logging.warning(f"Delivery to chat {chat_id} failed, retry in {retry}s: {e}")
+                    SEND_RETRIES.labels("error").inc()
+
+            if lane:
+                self._schedule(chat_id, retry)
+            else:
+                self._lanes.pop(chat_id, None)
+
+    async def start(self, db_session: Optional[AsyncSession] = None, owns: Optional[Callable[[int], bool]] = None) -> None:
+        if db_session is not None:
+            await self.restore(db_session, owns)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, db_session: Optional[AsyncSession] = None, timeout: float = config.SEND_DRAIN_TIMEOUT) -> None:
+        """Wait for the queue to drain, stop workers and persist what's left.
+
+        Args:
+            db_session (Optional[AsyncSession]): Session to persist undelivered items with.
+            timeout (float): Time to wait for the queue to drain.
+        """
+        deadline = time.monotonic() + timeout
+        while self._lanes and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if db_session is not None:
+            await self.persist(db_session)
+
+    async def persist(self, db_session: AsyncSession) -> None:
+        # Files uploaded meanwhile are persisted by file_id instead of their content.
+        for lane in self._lanes.values():
+            for delivery in lane:
+                for document in [delivery.payload.get("document"), *delivery.payload.get("documents", ())]:
+                    if isinstance(document, Attachment):
+                        self.attachments.pin(document)
+        
+        rows = [
+            PendingDelivery(
+                chat_id=delivery.chat_id,
+                method=delivery.method,
+                priority=delivery.priority,
+                payload=delivery.dump_payload()
+            )
+            for lane in self._lanes.values() for delivery in lane
+        ]
+        if rows:
+            db_session.add_all(rows)
+            await db_session.commit()
+            logging.info(f"Persisted {len(rows)} undelivered messages")
+        # Persisted deliveries are sent after the restart, their projects are seen now.
+        for lane in self._lanes.values():
+            while lane:
+                self._pop(lane)
+        self._lanes.clear()
+
+    async def restore(self, db_session: AsyncSession, owns: Optional[Callable[[int], bool]] = None) -> None:
+        """Load deliveries persisted on the previous shutdown.
+
+        Args:
+            db_session (AsyncSession): Session to load them with.
+            owns (Optional[Callable[[int], bool]]): Restore only chats it returns True for, all if None.
+        """
+        rows = (await db_session.scalars(select(PendingDelivery).order_by(PendingDelivery.id))).all()
+        if owns is not None:
+            rows = [row for row in rows if owns(row.chat_id)]
+        if not rows:
+            return
+
+        for row in rows:
+            self._push(Delivery.load(row))
+        if owns is None:
+            await db_session.execute(delete(PendingDelivery).where(PendingDelivery.id <= rows[-1].id))
+        else:
+            await db_session.execute(delete(PendingDelivery).where(PendingDelivery.id.in_([row.id for row in rows])))
+        await db_session.commit()
+        logging.info(f"Restored {len(rows)} undelivered messages")
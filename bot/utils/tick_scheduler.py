@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import math
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from config_reader import config
+from metrics import registry
+
+
+SCHEDULER_LAG = registry.histogram("scheduler_lag_seconds", "Delay between the scheduled and the actual start of a job", ("job",))
+SCHEDULER_SKIPPED = registry.counter("scheduler_skipped_total", "Scheduled runs skipped because the job was behind", ("job",))
+TICK_LAG = SCHEDULER_LAG.labels("tick")
+TICK_SKIPPED = SCHEDULER_SKIPPED.labels("tick")
+
+
+def phase_of(key: Hashable, slots: int) -> int:
+    """Get the deterministic phase slot of the key.
+
+    Args:
+        key (Hashable): Job key, e.g. user ID.
+        slots (int): Number of slots in the interval.
+
+    Returns:
+        int: Slot number in `[0, slots)`.
+    """
+    return zlib.crc32(str(key).encode()) % slots
+
+
+@dataclass
+class TickStats:
+    runs: int = 0
+    skipped: int = 0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    total_lag: float = 0.0
+
+    @property
+    def avg_lag(self) -> float:
+        return self.total_lag / self.runs if self.runs else 0.0
+
+
+class TickScheduler(object):
+    """Runs `func(slot)` for each of `slots` phases spread evenly over the interval.
+
+    Jobs are assigned to slots by `phase_of`, so a burst of users who enabled tracking at the
+    same moment is still spread over the whole interval. At most `max_concurrent` slot runs
+    are executed at once, a slot whose previous run is still going is skipped instead of
+    being queued, and the delay between the scheduled and the actual start is recorded.
+    """
+
+    def __init__(
+        self,
+        func: Callable[[int], Awaitable[None]],
+        interval: float = config.TICK_INTERVAL,
+        slots: int = config.TICK_SLOTS,
+        max_concurrent: int = config.TICK_MAX_CONCURRENT,
+        lag_warning: Optional[float] = None
+    ) -> None:
+        self.func = func
+        self.interval = interval
+        self.slots = slots
+        self.step = interval / slots
+        self.lag_warning = lag_warning if lag_warning is not None else self.step
+        self.stats = TickStats()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._running: Dict[int, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def phase(self, key: Hashable) -> int:
+        return phase_of(key, self.slots)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._task, *self._running.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._running.clear()
+
+    async def _loop(self) -> None:
+        started = time.monotonic()
+        step = 0
+
+        while True:
+            scheduled = started + step * self.step
+            await asyncio.sleep(max(0.0, scheduled - time.monotonic()))
+
+            slot = step % self.slots
+            previous = self._running.get(slot)
+            if previous is not None and not previous.done():
+                self.stats.skipped += 1
+                TICK_SKIPPED.inc()
+                logging.warning(f"Tick slot {slot} skipped: previous run is still in progress")
+            else:
+                self._running[slot] = asyncio.create_task(self._run(slot, scheduled))
+
+            step += 1
+            behind = time.monotonic() - (started + step * self.step)
+            if behind > self.step:
+                missed = math.floor(behind / self.step)
+                self.stats.skipped += missed
+                TICK_SKIPPED.inc(missed)
+                step += missed
+                logging.warning(f"Tick loop is {behind:.1f}s behind, {missed} slots skipped")
+
+    async def _run(self, slot: int, scheduled: float) -> None:
+        async with self._semaphore:
+            lag = time.monotonic() - scheduled
+            self.stats.runs += 1
+            self.stats.last_lag = lag
+            self.stats.max_lag = max(self.stats.max_lag, lag)
+            self.stats.total_lag += lag
+            TICK_LAG.observe(lag)
+            if lag > self.lag_warning:
+                logging.warning(f"Tick slot {slot} started {lag:.2f}s behind schedule")
+
+            try:
+                await self.func(slot)
+            except Exception as e:
+                logging.error(f"Tick slot {slot} failed: {e}")
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config_reader import config
+
+
+class WebhookHandler(SimpleRequestHandler):
+    """Webhook request handler with bounded update processing.
+
+    Telegram gets an immediate response and the update is handled in the background, at most
+    `concurrency` updates at once. On shutdown the handler stops taking new updates and waits
+    up to `drain_timeout` for the ones in progress before cancelling them.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: Optional[str] = None,
+        concurrency: int = config.WEBHOOK_CONCURRENCY,
+        drain_timeout: float = config.WEBHOOK_DRAIN_TIMEOUT,
+        **data: Any
+    ) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.drain_timeout = drain_timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._draining = False
+
+    @property
+    def in_progress(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._draining:
+            return web.Response(status=503, text="Shutting down")
+        return await super().handle(request)
+
+    __call__ = handle
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+            except Exception as e:
+                logging.error(f"Failed to handle update {update.get('update_id')}: {e}")
+
+    async def drain(self, *args: Any) -> None:
+        self._draining = True
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+
+        logging.info(f"Waiting for {len(tasks)} updates in progress")
+        _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            logging.warning(f"Cancelled {len(pending)} updates still in progress after {self.drain_timeout}s")
+
+    async def close(self) -> None:
+        # The bot session is closed by the dispatcher shutdown, the sender may still need it.
+        pass
+
+
+def create_app(dispatcher: Dispatcher, bot: Bot, path: str = config.WEBHOOK_PATH, **data: Any) -> web.Application:
+    """Build the aiohttp application receiving Telegram updates.
+
+    Args:
+        dispatcher (Dispatcher): Dispatcher with routers included.
+        bot (Bot): Bot instance.
+        path (str): Route of the webhook.
+        **data: Workflow data passed to handlers and startup/shutdown callbacks.
+
+    Returns:
+        web.Application: Application, its startup and shutdown run the dispatcher's ones.
+    """
+    secret = config.WEBHOOK_SECRET.get_secret_value() if config.WEBHOOK_SECRET else None
+    handler = WebhookHandler(dispatcher, bot, secret_token=secret, **data)
+
+    app = web.Application()
+    app["webhook_handler"] = handler
+    # Shutdown callbacks run in order: drain updates first, then the dispatcher shutdown.
+    app.on_shutdown.append(handler.drain)
+    setup_application(app, dispatcher, bot=bot, **data)
+    handler.register(app, path=path)
+    return app
@@ -1,11 +1,99 @@
+from typing import Literal, Optional, get_args
+
 from pydantic import SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+DeliveryMode = Literal["auto", "instant", "digest"]
+DELIVERY_MODES = get_args(DeliveryMode)
+
+
 class Config(BaseSettings):
     BOT_TOKEN: SecretStr
     DB_URL: SecretStr
     SUPPORT_CONTACT: str
+    ENCRYPTION_KEY: Optional[SecretStr] = None
+    
+    RUN_MODE: Literal["polling", "webhook"] = "polling"
+    WEBHOOK_URL: Optional[str] = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_SECRET: Optional[SecretStr] = None
+    WEBHOOK_CONCURRENCY: int = 32
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+    WEBHOOK_DRAIN_TIMEOUT: float = 10
+    
+    ROLE: Literal["all", "frontend", "worker", "cluster"] = "all"
+    WORKER_SHARDS: int = 1
+    WORKER_SHARD: int = 0
+    TRACKER_SYNC_INTERVAL: float = 10
+    
+    HTTP_POOL_LIMIT: int = 100
+    HTTP_POOL_LIMIT_PER_HOST: int = 20
+    HTTP_DNS_CACHE_TTL: int = 300
+    HTTP_KEEPALIVE_TIMEOUT: float = 60
+    HTTP_TIMEOUT: float = 30
+    
+    KWORK_BASE_URL: str = "https://kwork.ru"
+    KWORK_RELOGIN_INTERVAL: float = 15 * 60
+    KWORK_LOGIN_SPACING: float = 3
+    KWORK_CAPTCHA_BACKOFF: float = 6 * 3600
+    
+    SEND_WORKERS: int = 4
+    SEND_GLOBAL_RATE: float = 25
+    FRONTEND_SEND_RATE: float = 5
+    SEND_CHAT_RATE: float = 1
+    SEND_CHAT_BURST: float = 1
+    SEND_DRAIN_TIMEOUT: float = 5
+    
+    DELIVERY_MODE: DeliveryMode = "auto"
+    DIGEST_WINDOW: float = 300
+    DIGEST_HORIZON: float = 10
+    DIGEST_MAX_PROJECTS: int = 10
+    
+    ATTACHMENT_MAX_SIZE: int = 20 * 1024 * 1024
+    ATTACHMENT_FILE_ID_CACHE_SIZE: int = 4096
+    ATTACHMENT_FILE_ID_TTL: float = 7 * 24 * 3600
+    ATTACHMENT_CONTENT_CACHE_BYTES: int = 64 * 1024 * 1024
+    ATTACHMENT_CONTENT_CACHE_MAX_FILE: int = 4 * 1024 * 1024
+    
+    USER_CACHE_SIZE: int = 100_000
+    USER_CACHE_TTL: float = 3600
+    
+    RENDER_CACHE_SIZE: int = 2048
+    RENDER_CACHE_TTL: float = 3600
+    
+    FSM_TTL: float = 3600
+    FSM_CACHE_SIZE: int = 10_000
+    FSM_CACHE_TTL: float = 60
+    FSM_CLUSTER_CACHE_TTL: float = 5
+    FSM_CLEANUP_INTERVAL: float = 600
+    
+    OFFLOAD_EXECUTOR: Literal["thread", "process", "none"] = "thread"
+    OFFLOAD_WORKERS: int = 2
+    OFFLOAD_THRESHOLD: int = 64 * 1024
+    LOOP_LAG_INTERVAL: float = 0.5
+    LOOP_LAG_WARNING: float = 0.1
+    
+    TICK_CONCURRENCY: int = 8
+    TICK_INTERVAL: float = 60
+    TICK_SLOTS: int = 12
+    TICK_MAX_CONCURRENT: int = 4
+    
+    STATE_FLUSH_INTERVAL: float = 5
+    STATE_FLUSH_SIZE: int = 5000
+    
+    LOG_FILE: str = "logs/logs.log"
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: Literal["text", "json"] = "text"
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT: int = 5
+    LOG_DEDUP_INTERVAL: float = 60
+    
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: Optional[int] = None
+    PROFILER_INTERVAL: float = 0.005
 
     model_config = SettingsConfigDict(
         env_file=".env",
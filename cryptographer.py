@@ -1,21 +1,83 @@
-from typing import Optional
+import base64
+import os
+from typing import Optional, Dict, Tuple
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives import hashes
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+from config_reader import config
+from metrics import registry
+from offload import offloader
 
-private_key = rsa.generate_private_key(public_exponent=65537, key_size=8192, backend=default_backend())
-public_key = private_key.public_key()
+
+# By default the data key lives only in memory, so everything encrypted with it is lost on restart.
+# Set ENCRYPTION_KEY (urlsafe base64 of 32 bytes) to keep credentials and trackers across restarts.
+if config.ENCRYPTION_KEY:
+    data_key = base64.urlsafe_b64decode(config.ENCRYPTION_KEY.get_secret_value())
+else:
+    data_key = AESGCM.generate_key(bit_length=256)
+aead = AESGCM(data_key)
+
+NONCE_SIZE = 12
+
+_cookie_cache: Dict[int, Tuple[bytes, str]] = {}
+
+DECRYPT_SECONDS = registry.histogram(
+    "decrypt_seconds", "Duration of AES-GCM decryption",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01)
+)
+COOKIE_CACHE = registry.counter("cookie_cache_lookups_total", "Lookups of decrypted cookies", ("result",))
+COOKIE_CACHE_HIT = COOKIE_CACHE.labels("hit")
+COOKIE_CACHE_MISS = COOKIE_CACHE.labels("miss")
 
 
 def encrypt(data: str) -> bytes:
-    return public_key.encrypt(data.encode(), padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None))
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + aead.encrypt(nonce, data.encode(), None)
 
 
+@DECRYPT_SECONDS.timed
 def decrypt(data: bytes) -> Optional[str]:
     try:
-        return private_key.decrypt(data, padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)).decode()
-    except:
-        return None 
+        return aead.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], None).decode()
+    except (InvalidTag, ValueError, TypeError):
+        return None
+
+
+async def encrypt_async(data: str) -> bytes:
+    return await offloader.run(encrypt, data, size=len(data), shared=True)
+
+
+async def decrypt_async(data: bytes) -> Optional[str]:
+    return await offloader.run(decrypt, data, size=len(data), shared=True)
+
+
+def decrypt_cookie(user_id: int, data: Optional[bytes]) -> Optional[str]:
+    """Decrypt the user's cookie, reusing the plaintext while the ciphertext is unchanged.
+
+    Args:
+        user_id (int): Telegram user ID.
+        data (Optional[bytes]): Encrypted cookie.
+
+    Returns:
+        Optional[str]: Cookie or None if it can't be decrypted.
+    """
+    if not data:
+        return None
+
+    cached = _cookie_cache.get(user_id)
+    if cached is not None and cached[0] == data:
+        COOKIE_CACHE_HIT.inc()
+        return cached[1]
+
+    COOKIE_CACHE_MISS.inc()
+    cookie = decrypt(data)
+    if cookie is None:
+        _cookie_cache.pop(user_id, None)
+    else:
+        _cookie_cache[user_id] = (bytes(data), cookie)
+    return cookie
+
+
+def invalidate_cookie(user_id: int) -> None:
+    _cookie_cache.pop(user_id, None)
@@ -1,3 +1,9 @@
 from .base import Base
-from .models import User, KworkSession
-from .engine import _engine, _sessionmaker
\ No newline at end of file
+from .models import User, KworkSession, SeenProject, PendingDelivery, Tracker, FSMRecord, SchemaVersion, ProjectFilter
+from .engine import _engine, _sessionmaker
+from .schema import bootstrap_schema
+from .seen import SeenProjectsStore
+from .write_buffer import TrackingStateBuffer
+from .trackers import enable_tracking, disable_tracking, is_tracking, load_trackers
+from .filters import get_filter, save_filter, delete_filter, load_filters
+from .users import load_delivery_modes
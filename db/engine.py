@@ -1,7 +1,51 @@
+import time
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from config_reader import config
+from metrics import registry
 
 
 _engine = create_async_engine(url=config.DB_URL.get_secret_value())
 _sessionmaker = async_sessionmaker(bind=_engine, expire_on_commit=False)
+
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+
+
+if _engine.dialect.name == "sqlite":
+    @event.listens_for(_engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+        # WAL lets handlers read while the tracking state is flushed, NORMAL sync is durable
+        # enough in WAL mode and avoids an fsync on every commit.
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+QUERY_SECONDS = registry.histogram("db_query_seconds", "Duration of database statements", ("statement",))
+QUERY_KINDS = {kind: QUERY_SECONDS.labels(kind) for kind in ("select", "insert", "update", "delete", "other")}
+
+
+@event.listens_for(_engine.sync_engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany) -> None:
+    # Statements of one connection never overlap, a failed one leaves a mark the next overwrites.
+    conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(_engine.sync_engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    kind = statement.lstrip()[:6].lower()
+    QUERY_KINDS.get(kind, QUERY_KINDS["other"]).observe(elapsed)
@@ -0,0 +1,42 @@
+from typing import List, Optional
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ProjectFilter
+
+
+async def get_filter(db_session: AsyncSession, user_id: int) -> Optional[ProjectFilter]:
+    return await db_session.get(ProjectFilter, user_id)
+
+
+async def save_filter(db_session: AsyncSession, project_filter: ProjectFilter) -> None:
+    """Insert or replace the user's filter (the caller commits).
+
+    Args:
+        db_session (AsyncSession): The asynchronous session for database operations.
+        project_filter (ProjectFilter): Filter with `user_id` set.
+    """
+    await db_session.merge(project_filter)
+
+
+async def delete_filter(db_session: AsyncSession, user_id: int) -> None:
+    """Remove the user's filter (the caller commits).
+
+    Args:
+        db_session (AsyncSession): The asynchronous session for database operations.
+        user_id (int): Telegram user ID.
+    """
+    await db_session.execute(delete(ProjectFilter).where(ProjectFilter.user_id == user_id))
+
+
+async def load_filters(db_session: AsyncSession) -> List[ProjectFilter]:
+    """Load the filters of all users with one query.
+
+    Args:
+        db_session (AsyncSession): The asynchronous session for database operations.
+
+    Returns:
+        List[ProjectFilter]: Filters.
+    """
+    return list(await db_session.scalars(select(ProjectFilter)))
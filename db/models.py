@@ -1,6 +1,6 @@
-import json
+from datetime import datetime
 
-from sqlalchemy import BigInteger, LargeBinary, String, ForeignKey, Text
+from sqlalchemy import BigInteger, Integer, LargeBinary, String, ForeignKey, DateTime, Index, Text, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -13,6 +13,7 @@ class User(Base):
     username: Mapped[str] = mapped_column(String, nullable=True)
     first_name: Mapped[str] = mapped_column(String, nullable=False)
     last_name: Mapped[str] = mapped_column(String, nullable=True)
+    delivery_mode: Mapped[str] = mapped_column(String, nullable=True)
     
     kwork_session: Mapped["KworkSession"] = relationship("KworkSession", back_populates="user", foreign_keys="KworkSession.user_id")
     
@@ -24,6 +25,66 @@ class KworkSession(Base):
     login: Mapped[LargeBinary] = mapped_column(LargeBinary(), nullable=True)
     password: Mapped[LargeBinary] = mapped_column(LargeBinary(), nullable=True)
     cookie: Mapped[LargeBinary] = mapped_column(LargeBinary(), nullable=True)
-    last_projects: Mapped[list[BigInteger]] = mapped_column(Text, nullable=True, default=json.dumps(list()))
     
     user: Mapped["User"] = relationship("User", back_populates="kwork_session", foreign_keys=[user_id])
+    
+    
+class SeenProject(Base):
+    __tablename__ = "seen_projects"
+    __table_args__ = (
+        Index("ix_seen_projects_user_id_seen_at", "user_id", "seen_at"),
+    )
+    
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    project_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    seen_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+    
+    
+class PendingDelivery(Base):
+    __tablename__ = "pending_deliveries"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    method: Mapped[str] = mapped_column(String, nullable=False)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+    
+    
+class Tracker(Base):
+    __tablename__ = "trackers"
+    
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    enabled_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+    last_polled_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    last_delivered_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    
+    
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    
+    
+class FSMRecord(Base):
+    __tablename__ = "fsm_records"
+    
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    state: Mapped[str] = mapped_column(String, nullable=True)
+    data: Mapped[LargeBinary] = mapped_column(LargeBinary(), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+    
+    
+class ProjectFilter(Base):
+    __tablename__ = "project_filters"
+    
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    keywords: Mapped[str] = mapped_column(Text, nullable=True)
+    negative_keywords: Mapped[str] = mapped_column(Text, nullable=True)
+    min_price: Mapped[int] = mapped_column(Integer, nullable=True)
+    min_possible_price: Mapped[int] = mapped_column(Integer, nullable=True)
+    min_hired_percent: Mapped[int] = mapped_column(Integer, nullable=True)
+    max_kwork_count: Mapped[int] = mapped_column(Integer, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
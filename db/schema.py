@@ -0,0 +1,82 @@
+import logging
+import time
+from typing import Callable, Dict
+
+from sqlalchemy import Column, Connection, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .base import Base
+from .models import SchemaVersion, Tracker, User
+
+
+def add_column(connection: Connection, column: Column) -> None:
+    """Add a nullable column to an existing table if it's missing."""
+    table = column.table
+    columns = {info["name"] for info in inspect(connection).get_columns(table.name)}
+    if column.name in columns:
+        return
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def migrate_1(connection: Connection) -> None:
+    """Trackers: last poll and delivery times."""
+    add_column(connection, Tracker.__table__.c.last_polled_at)
+    add_column(connection, Tracker.__table__.c.last_delivered_at)
+
+
+def migrate_2(connection: Connection) -> None:
+    """Users: project delivery mode."""
+    add_column(connection, User.__table__.c.delivery_mode)
+
+
+# Version -> migration bringing the schema from the previous version. Migrations must be
+# idempotent, a database without a version row runs all of them.
+MIGRATIONS: Dict[int, Callable[[Connection], None]] = {
+    1: migrate_1,
+    2: migrate_2,
+}
+SCHEMA_VERSION = max(MIGRATIONS)
+
+
+def create_missing(connection: Connection) -> bool:
+    """Create missing tables and indexes.
+
+    Returns:
+        bool: True if the database was empty.
+    """
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    Base.metadata.create_all(connection, checkfirst=True)
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        indexes = {info["name"] for info in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+    return not existing
+
+
+def upgrade(connection: Connection) -> int:
+    fresh = create_missing(connection)
+    version = connection.scalar(select(SchemaVersion.version))
+
+    if version is None:
+        version = SCHEMA_VERSION if fresh else 0
+        connection.execute(SchemaVersion.__table__.insert().values(id=1, version=version))
+
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        logging.info(f"Migrating schema to version {number}: {MIGRATIONS[number].__doc__}")
+        MIGRATIONS[number](connection)
+        connection.execute(SchemaVersion.__table__.update().values(version=number))
+    return version
+
+
+async def bootstrap_schema(engine: AsyncEngine) -> None:
+    """Bring the database schema up to date without touching the data."""
+    started = time.perf_counter()
+    async with engine.begin() as connection:
+        version = await connection.run_sync(upgrade)
+    logging.info(f"Schema is at version {SCHEMA_VERSION} (was {version}), checked in {time.perf_counter() - started:.3f}s")
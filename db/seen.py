@@ -0,0 +1,91 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Set, TYPE_CHECKING
+
+from sqlalchemy import select, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import SeenProject
+
+if TYPE_CHECKING:
+    from .write_buffer import TrackingStateBuffer
+
+
+class SeenProjectsStore(object):
+    """Projects already delivered to users.
+
+    Rows live in the `seen_projects` table, the ids of every tracked user are cached in
+    memory as a set, so checking whether a project is new doesn't touch the database.
+    New rows are written by the `TrackingStateBuffer` in batches.
+
+    Projects queued for delivery are only `reserve`d in memory, their rows are written by
+    `mark_seen` once the sender is done with them.
+    """
+
+    def __init__(self, buffer: "TrackingStateBuffer", max_age: timedelta = timedelta(days=30)) -> None:
+        self.buffer = buffer
+        self.max_age = max_age
+        self._seen: Dict[int, Set[int]] = {}
+
+    async def load(self, db_session: AsyncSession, user_id: int) -> Set[int]:
+        seen = self._seen.get(user_id)
+        if seen is None:
+            rows = await db_session.scalars(select(SeenProject.project_id).where(SeenProject.user_id == user_id))
+            seen = set(rows) | self.buffer.pending_seen(user_id)
+            self._seen[user_id] = seen
+        return seen
+
+    def is_new(self, user_id: int, project_id: int) -> bool:
+        return project_id not in self._seen.get(user_id, ())
+
+    def reserve(self, user_id: int, project_ids: Iterable[int]) -> None:
+        """Add projects to the user's seen set without writing them.
+
+        Args:
+            user_id (int): Telegram user ID.
+            project_ids (Iterable[int]): Kwork project IDs queued for delivery.
+        """
+        seen = self._seen.get(user_id)
+        if seen is not None:
+            seen.update(project_ids)
+
+    def mark_seen(self, user_id: int, project_ids: Iterable[int]) -> None:
+        """Add projects to the user's seen set and queue their rows for the next flush.
+
+        Args:
+            user_id (int): Telegram user ID.
+            project_ids (Iterable[int]): Kwork project IDs.
+        """
+        project_ids = set(project_ids)
+        if not project_ids:
+            return
+
+        # A user that isn't loaded (forgotten or pruned meanwhile) only gets the rows, the
+        # next `load` reads them together with the rest of the user's projects.
+        seen = self._seen.get(user_id)
+        if seen is not None:
+            seen |= project_ids
+        self.buffer.add_seen(user_id, project_ids)
+
+    def forget(self, user_id: int) -> None:
+        self._seen.pop(user_id, None)
+
+    async def prune(self, db_session: AsyncSession) -> None:
+        border = datetime.now() - self.max_age
+        result = await db_session.execute(delete(SeenProject).where(SeenProject.seen_at < border))
+        await db_session.commit()
+        self._seen.clear()
+        logging.info(f"Pruned {result.rowcount} seen projects older than {border}")
+
+
+def insert_ignore(db_session: AsyncSession, rows: list):
+    """Build a bulk insert of seen projects that skips existing rows."""
+    dialect = db_session.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(SeenProject).values(rows).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(SeenProject).values(rows).on_conflict_do_nothing()
+    if dialect in ("mysql", "mariadb"):
+        return SeenProject.__table__.insert().prefix_with("IGNORE").values(rows)
+    return SeenProject.__table__.insert().values(rows)
@@ -0,0 +1,49 @@
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import KworkSession, Tracker
+
+
+async def enable_tracking(db_session: AsyncSession, user_id: int, chat_id: int) -> None:
+    """Register the user's tracker (the caller commits).
+
+    Args:
+        db_session (AsyncSession): The asynchronous session for database operations.
+        user_id (int): Telegram user ID.
+        chat_id (int): Chat that receives the projects.
+    """
+    await db_session.merge(Tracker(user_id=user_id, chat_id=chat_id))
+
+
+async def disable_tracking(db_session: AsyncSession, user_ids: Iterable[int]) -> None:
+    """Remove trackers of the users (the caller commits).
+
+    Args:
+        db_session (AsyncSession): The asynchronous session for database operations.
+        user_ids (Iterable[int]): Telegram user IDs.
+    """
+    user_ids = list(user_ids)
+    if user_ids:
+        await db_session.execute(delete(Tracker).where(Tracker.user_id.in_(user_ids)))
+
+
+async def is_tracking(db_session: AsyncSession, user_id: int) -> bool:
+    return await db_session.get(Tracker, user_id) is not None
+
+
+async def load_trackers(db_session: AsyncSession) -> List[Tuple[int, int, Optional[bytes]]]:
+    """Load all enabled trackers with one query.
+
+    Args:
+        db_session (AsyncSession): The asynchronous session for database operations.
+
+    Returns:
+        List[Tuple[int, int, Optional[bytes]]]: User ID, chat ID and encrypted cookie of each tracker.
+    """
+    rows = await db_session.execute(
+        select(Tracker.user_id, Tracker.chat_id, KworkSession.cookie)
+        .outerjoin(KworkSession, KworkSession.user_id == Tracker.user_id)
+    )
+    return [tuple(row) for row in rows]
@@ -0,0 +1,19 @@
+from typing import Dict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import User
+
+
+async def load_delivery_modes(db_session: AsyncSession) -> Dict[int, str]:
+    """Load the delivery modes users have chosen with one query.
+
+    Args:
+        db_session (AsyncSession): The asynchronous session for database operations.
+
+    Returns:
+        Dict[int, str]: User ID -> mode, users with the default mode are left out.
+    """
+    rows = await db_session.execute(select(User.id, User.delivery_mode).where(User.delivery_mode.is_not(None)))
+    return {user_id: mode for user_id, mode in rows}
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config_reader import config
+from .models import Tracker
+from .seen import insert_ignore
+
+
+class TrackingStateBuffer(object):
+    """Write-behind buffer of the tracking state.
+
+    Seen projects, poll times and delivery times are collected in memory and written in one
+    transaction every `flush_interval` seconds or as soon as `max_pending` changes pile up,
+    instead of a commit per user and tick. Changes of a failed flush are kept for the next one.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        flush_interval: float = config.STATE_FLUSH_INTERVAL,
+        max_pending: int = config.STATE_FLUSH_SIZE,
+        insert_chunk: int = 500
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.insert_chunk = insert_chunk
+        self._seen: Dict[int, Dict[int, datetime]] = {}
+        self._seen_count = 0
+        self._flushing_seen: Dict[int, Dict[int, datetime]] = {}
+        self._polled: Dict[int, datetime] = {}
+        self._delivered: Dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return self._seen_count + len(self._polled) + len(self._delivered)
+
+    def add_seen(self, user_id: int, project_ids: Iterable[int]) -> None:
+        now = datetime.now()
+        seen = self._seen.setdefault(user_id, {})
+        for project_id in project_ids:
+            if project_id not in seen:
+                seen[project_id] = now
+                self._seen_count += 1
+        self._check_size()
+
+    def pending_seen(self, user_id: int) -> Set[int]:
+        return set(self._seen.get(user_id, ())) | set(self._flushing_seen.get(user_id, ()))
+
+    def polled(self, user_ids: Iterable[int]) -> None:
+        now = datetime.now()
+        for user_id in user_ids:
+            self._polled[user_id] = now
+        self._check_size()
+
+    def delivered(self, chat_id: int) -> None:
+        self._delivered[chat_id] = datetime.now()
+        self._check_size()
+
+    def _check_size(self) -> None:
+        if self.pending >= self.max_pending:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write everything that is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self.pending:
+                return
+
+            seen, self._seen = self._seen, {}
+            seen_count, self._seen_count = self._seen_count, 0
+            polled, self._polled = self._polled, {}
+            delivered, self._delivered = self._delivered, {}
+            self._flushing_seen = seen
+
+            try:
+                async with self.sessionmaker() as db_session:
+                    await self._write(db_session, seen, polled, delivered)
+                    await db_session.commit()
+            except Exception as e:
+                logging.error(f"Failed to flush tracking state, keeping {seen_count + len(polled) + len(delivered)} changes: {e}")
+                for user_id, projects in seen.items():
+                    self._seen.setdefault(user_id, {}).update(projects)
+                self._seen_count = sum(len(projects) for projects in self._seen.values())
+                for key, value in polled.items():
+                    self._polled.setdefault(key, value)
+                for key, value in delivered.items():
+                    self._delivered.setdefault(key, value)
+            finally:
+                self._flushing_seen = {}
+
+    async def _write(self, db_session: AsyncSession, seen: Dict[int, Dict[int, datetime]], polled: Dict[int, datetime], delivered: Dict[int, datetime]) -> None:
+        trackers = Tracker.__table__
+
+        if seen:
+            rows = [
+                {"user_id": user_id, "project_id": project_id, "seen_at": seen_at}
+                for user_id, projects in seen.items() for project_id, seen_at in projects.items()
+            ]
+            for i in range(0, len(rows), self.insert_chunk):
+                await db_session.execute(insert_ignore(db_session, rows[i:i + self.insert_chunk]))
+
+        if polled:
+            await db_session.execute(
+                update(trackers).where(trackers.c.user_id == bindparam("b_user_id")).values(last_polled_at=bindparam("b_at")),
+                [{"b_user_id": user_id, "b_at": polled_at} for user_id, polled_at in polled.items()]
+            )
+
+        if delivered:
+            await db_session.execute(
+                update(trackers).where(trackers.c.chat_id == bindparam("b_chat_id")).values(last_delivered_at=bindparam("b_at")),
+                [{"b_chat_id": chat_id, "b_at": delivered_at} for chat_id, delivered_at in delivered.items()]
+            )
@@ -0,0 +1,182 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Iterator, List, Optional
+
+from config_reader import config
+
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] (%(funcName)s) %(message)s"
+
+log_user_id: ContextVar[Optional[int]] = ContextVar("log_user_id", default=None)
+log_tick_id: ContextVar[Optional[int]] = ContextVar("log_tick_id", default=None)
+
+_UNSET = object()
+_NUMBERS = re.compile(r"\d+")
+
+
+@contextmanager
+def log_context(user_id: Optional[int] = _UNSET, tick_id: Optional[int] = _UNSET) -> Iterator[None]:
+    """Attach the user and tick IDs to the records logged inside the block.
+
+    The IDs live in context variables, so they follow the current task and the tasks it
+    creates and never leak into concurrent ones.
+    """
+    tokens = []
+    if user_id is not _UNSET:
+        tokens.append((log_user_id, log_user_id.set(user_id)))
+    if tick_id is not _UNSET:
+        tokens.append((log_tick_id, log_tick_id.set(tick_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the log context of the calling task onto the record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.user_id = log_user_id.get()
+        record.tick_id = log_tick_id.get()
+        return True
+
+
+class DuplicateFilter(logging.Filter):
+    """Lets one of the repeating warnings and errors through per `interval` seconds.
+
+    Messages are compared with numbers masked, so "Failed to get projects with status code:
+    502" for different users is one message. The first record after the interval says how
+    many were suppressed; a burst that never repeats after the interval isn't summarized.
+    """
+
+    def __init__(self, interval: float = config.LOG_DEDUP_INTERVAL, max_keys: int = 1024) -> None:
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self._seen: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.interval <= 0:
+            return True
+
+        message = record.getMessage()
+        key = (record.levelno, record.funcName, _NUMBERS.sub("#", message))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            self._seen[key] = [now, 0]
+            self._seen.move_to_end(key)
+            if len(self._seen) > self.max_keys:
+                self._seen.popitem(last=False)
+
+        if suppressed:
+            record.msg = f"{message} ({suppressed} similar suppressed in {self.interval:g}s)"
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the user and tick IDs of the log context."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "message": record.getMessage()
+        }
+        user_id = getattr(record, "user_id", None)
+        tick_id = getattr(record, "tick_id", None)
+        if user_id is not None:
+            payload["user_id"] = user_id
+        if tick_id is not None:
+            payload["tick_id"] = tick_id
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler leaving the formatting to the listener thread.
+
+    The stock `prepare` formats the record, traceback included, in the calling thread so it
+    can be pickled; the queue here never leaves the process, so only the message is merged.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(
+    path: str = config.LOG_FILE,
+    level: str = config.LOG_LEVEL,
+    fmt: str = config.LOG_FORMAT,
+    max_bytes: int = config.LOG_MAX_BYTES,
+    backup_count: int = config.LOG_BACKUP_COUNT,
+    dedup_interval: float = config.LOG_DEDUP_INTERVAL
+) -> QueueListener:
+    """Route the root logger through a queue to a rotating file and stderr.
+
+    Loggers only put records into the queue, the writes happen in the listener thread, so a
+    slow disk doesn't stall the event loop. The listener is stopped, and the queue flushed,
+    at interpreter exit.
+
+    Args:
+        path (str): Log file, rotated when it reaches `max_bytes`.
+        level (str): Level of the root logger.
+        fmt (str): "text" or "json".
+        max_bytes (int): Size of the log file that triggers rotation.
+        backup_count (int): Number of rotated files to keep.
+        dedup_interval (float): Interval of `DuplicateFilter`, 0 to log every repeat.
+
+    Returns:
+        QueueListener: The started listener.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [
+        RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DuplicateFilter(dedup_interval))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
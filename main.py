@@ -7,59 +7,272 @@ SUPPORT_CONTACT = os.getenv("SUPPORT_CONTACT")
 import asyncio
 import logging
 import os
+import signal
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums.parse_mode import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiohttp import web
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED, JobEvent
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from config_reader import config
+from logging_setup import setup_logging
+from offload import offloader
 from bot.handlers import setup_routers
-from db import Base, _engine
+from bot.utils.poller import ProjectsPoller
+from bot.utils.sender import TelegramSender
+from bot.utils.attachments import AttachmentPipeline
+from bot.utils.fsm_storage import DBStorage
+from bot.utils.loop_monitor import LoopLagMonitor
+from bot.utils.metrics_server import MetricsServer
+from bot.utils.tick_scheduler import TickScheduler, SCHEDULER_LAG, SCHEDULER_SKIPPED
+from bot.utils.webhook import create_app
+from api import HttpPool, KworkSessionManager
+from db import _engine, _sessionmaker, bootstrap_schema, SeenProjectsStore, TrackingStateBuffer
 
 
-os.makedirs("logs", exist_ok=True)
-os.makedirs("temp", exist_ok=True)
+def log_path() -> str:
+    # Rotation isn't safe with several writers, so every process of a cluster has its own file.
+    if config.ROLE == "all":
+        return config.LOG_FILE
+    stem, ext = os.path.splitext(config.LOG_FILE)
+    suffix = f"worker-{config.WORKER_SHARD}" if config.ROLE == "worker" else config.ROLE
+    return f"{stem}.{suffix}{ext}"
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] (%(funcName)s) %(message)s",
-    handlers=[
-        logging.FileHandler("logs/logs.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+
+setup_logging(log_path())
 
 bot = Bot(
     token=config.BOT_TOKEN.get_secret_value(), 
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher(storage=MemoryStorage())
+fsm_storage = DBStorage(_sessionmaker)
+dp = Dispatcher(storage=fsm_storage)
 
 scheduler = AsyncIOScheduler()
 scheduler.configure(timezone="Europe/Moscow")
 
 
-async def start_polling() -> None:   
+def send_rate() -> float:
+    """Share of the global Telegram limit this process may send at.
+
+    The frontend reserves `FRONTEND_SEND_RATE` of the limit and each worker, sending to its
+    own shard of chats, gets an equal part of the rest. Handler replies go through
+    `message.answer` rather than the sender, so the frontend's share is only kept free for
+    them, not enforced.
+    """
+    if config.ROLE == "frontend":
+        return config.FRONTEND_SEND_RATE
+    if config.ROLE == "worker":
+        return (config.SEND_GLOBAL_RATE - config.FRONTEND_SEND_RATE) / config.WORKER_SHARDS
+    return config.SEND_GLOBAL_RATE
+
+
+http_pool = HttpPool()
+sessions = KworkSessionManager(http_pool, _sessionmaker)
+state_buffer = TrackingStateBuffer(_sessionmaker)
+seen_store = SeenProjectsStore(state_buffer)
+attachments = AttachmentPipeline()
+sender = TelegramSender(bot, attachments, global_rate=send_rate(), on_delivered=state_buffer.delivered, on_seen=seen_store.mark_seen)
+poller = ProjectsPoller(
+    http_pool, seen_store, sender, attachments, sessions,
+    shard=None if config.ROLE == "frontend" else config.WORKER_SHARD if config.ROLE == "worker" else 0,
+    shards=config.WORKER_SHARDS if config.ROLE == "worker" else 1
+)
+tick_scheduler = TickScheduler(poller.tick, slots=poller.slots)
+loop_monitor = LoopLagMonitor()
+
+
+def metrics_port() -> Optional[int]:
+    # Processes of a cluster share the host: workers use the ports following METRICS_PORT.
+    if config.METRICS_PORT is None or config.ROLE != "worker":
+        return config.METRICS_PORT
+    return config.METRICS_PORT + 1 + config.WORKER_SHARD
+
+
+metrics_server = MetricsServer(port=metrics_port())
+
+
+async def prune_seen_projects() -> None:
+    async with _sessionmaker() as db_session:
+        await seen_store.prune(db_session)
+
+
+def record_job_lag(event: JobEvent) -> None:
+    if event.code == EVENT_JOB_MISSED:
+        SCHEDULER_SKIPPED.labels(event.job_id).inc()
+    else:
+        lag = datetime.now(timezone.utc) - event.scheduled_run_times[-1]
+        SCHEDULER_LAG.labels(event.job_id).observe(max(0.0, lag.total_seconds()))
+
+
+def add_jobs() -> None:
+    scheduler.add_listener(record_job_lag, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+    scheduler.add_job(
+        func=prune_seen_projects, 
+        id="prune_seen_projects", 
+        trigger="interval", 
+        hours=24
+    )
+    if config.ROLE != "worker":
+        scheduler.add_job(
+            func=fsm_storage.cleanup,
+            id="cleanup_fsm_states",
+            trigger="interval",
+            seconds=config.FSM_CLEANUP_INTERVAL
+        )
+    if config.ROLE == "worker":
+        scheduler.add_job(
+            func=poller.sync,
+            id="sync_trackers",
+            trigger="interval",
+            seconds=config.TRACKER_SYNC_INTERVAL
+        )
     scheduler.start()
+
+
+def setup() -> None:
+    add_jobs()
     dp.include_router(setup_routers())
+    dp.workflow_data.update(scheduler=scheduler, poller=poller, http_pool=http_pool, sessions=sessions)
+
+
+async def start_polling() -> None:   
+    setup()
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot, scheduler=scheduler)
+    await dp.start_polling(bot)
+
+
+def stop_event() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+async def start_webhook() -> None:
+    """Serve Telegram updates with an aiohttp app in this event loop.
+
+    Without `WEBHOOK_URL` the webhook isn't registered in Telegram, so the app can be tested
+    locally by POSTing updates to `WEBHOOK_PATH`.
+    """
+    setup()
+    app = create_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    stop = stop_event()
+    
+    try:
+        await web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT).start()
+        if config.WEBHOOK_URL:
+            await bot.set_webhook(
+                url=config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET.get_secret_value(),
+                max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=True
+            )
+        logging.info(f"Webhook server is listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
     
     
 @dp.startup()
 async def on_startup() -> None:
-    async with _engine.begin() as connection:
-        await connection.run_sync(Base.metadata.drop_all)
-        await connection.run_sync(Base.metadata.create_all)
+    started = time.perf_counter()
+    loop_monitor.start()
+    await metrics_server.start()
+    await bootstrap_schema(_engine)
+    await http_pool.start()
+    state_buffer.start()
+    async with _sessionmaker() as db_session:
+        # Trackers are private chats, so the chat ID is the user ID the shard is chosen by.
+        await sender.start(db_session, owns=None if config.ROLE == "all" else poller.owns)
+    if config.ROLE != "frontend":
+        await poller.rehydrate()
+        tick_scheduler.start()
+    logging.info(f"Started in {time.perf_counter() - started:.3f}s")
     
     
 @dp.shutdown()
 async def on_shutdown() -> None:
-    await _engine.dispose()
     scheduler.shutdown(wait=False)
+    await tick_scheduler.stop()
+    await poller.digests.flush_all()
+    async with _sessionmaker() as db_session:
+        await sender.stop(db_session)
+    await state_buffer.stop()
+    await http_pool.close()
+    await loop_monitor.stop()
+    await metrics_server.stop()
+    offloader.shutdown()
+    await _engine.dispose()
+
+
+async def start_worker() -> None:
+    """Track the shard `WORKER_SHARD` of `WORKER_SHARDS` without handling Telegram updates."""
+    add_jobs()
+    stop = stop_event()
+    await on_startup()
+    try:
+        await stop.wait()
+    finally:
+        await on_shutdown()
+        await bot.session.close()
+
+
+async def start_cluster() -> None:
+    """Run a frontend process handling updates and `WORKER_SHARDS` tracking workers.
+
+    The processes share the database: the frontend writes trackers, each worker picks up the
+    trackers of its shard with `ProjectsPoller.sync`.
+    """
+    await bootstrap_schema(_engine)
+    await _engine.dispose()
+    
+    roles = [{"ROLE": "frontend"}]
+    roles += [{"ROLE": "worker", "WORKER_SHARD": str(shard)} for shard in range(config.WORKER_SHARDS)]
+    processes = [
+        await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), env={**os.environ, **role})
+        for role in roles
+    ]
+    logging.info(f"Started frontend and {config.WORKER_SHARDS} workers")
+    
+    stop = stop_event()
+    waiters = [asyncio.create_task(process.wait()) for process in processes]
+    await asyncio.wait([asyncio.create_task(stop.wait()), *waiters], return_when=asyncio.FIRST_COMPLETED)
+    
+    for process in processes:
+        if process.returncode is None:
+            process.send_signal(signal.SIGTERM)
+    await asyncio.gather(*waiters)
+
+
+async def main() -> None:
+    if config.ROLE != "all" and not config.ENCRYPTION_KEY:
+        raise SystemExit(f"ROLE={config.ROLE} requires ENCRYPTION_KEY shared by all processes")
+    if config.RUN_MODE == "webhook" and config.WEBHOOK_URL and not config.WEBHOOK_SECRET:
+        raise SystemExit("WEBHOOK_URL requires WEBHOOK_SECRET, otherwise anyone who finds the path can post updates")
+    if config.ROLE != "all" and config.FRONTEND_SEND_RATE >= config.SEND_GLOBAL_RATE:
+        raise SystemExit("FRONTEND_SEND_RATE must be lower than SEND_GLOBAL_RATE, workers send at the rest of it")
+    
+    if config.ROLE == "cluster":
+        await start_cluster()
+    elif config.ROLE == "worker":
+        await start_worker()
+    elif config.RUN_MODE == "webhook":
+        await start_webhook()
+    else:
+        await start_polling()
 
 
 if __name__ == "__main__":
-    asyncio.run(start_polling())
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from config_reader import config
+
+
+T = TypeVar("T")
+
+
+class Offloader(object):
+    """Runs CPU-bound calls with large payloads outside the event loop.
+
+    Calls whose payload is at least `threshold` bytes go to the configured pool ("thread",
+    "process" or "none" to run everything inline), smaller ones run inline because handing
+    them over costs more than the work itself. Functions that depend on process state (the
+    data key of `cryptographer`) pass `shared=True` and always use a thread.
+    """
+
+    def __init__(
+        self,
+        kind: str = config.OFFLOAD_EXECUTOR,
+        workers: int = config.OFFLOAD_WORKERS,
+        threshold: int = config.OFFLOAD_THRESHOLD
+    ) -> None:
+        self.kind = kind
+        self.workers = workers
+        self.threshold = threshold
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self, shared: bool) -> Optional[Executor]:
+        if self.kind == "none":
+            return None
+        if self.kind == "process" and not shared:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.workers)
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="offload")
+        return self._threads
+
+    async def run(self, func: Callable[..., T], *args: Any, size: int = 0, shared: bool = False) -> T:
+        """Call `func(*args)`, in the pool if the payload is large enough.
+
+        Args:
+            func (Callable[..., T]): Function to call, module-level for the process pool.
+            *args: Arguments of the function.
+            size (int): Payload size in bytes.
+            shared (bool): The function needs the state of this process.
+
+        Returns:
+            T: Result of the function.
+        """
+        executor = self._executor(shared) if size >= self.threshold else None
+        if executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args))
+
+    def shutdown(self) -> None:
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._threads = None
+        self._processes = None
+        logging.info("Offload executors are shut down")
+
+
+offloader = Offloader()
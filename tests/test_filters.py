@@ -0,0 +1,57 @@
+import unittest
+
+from api import Project
+from bot.utils import filters
+from bot.utils.filters import Automaton, FilterIndex, UserFilter
+
+
+def project(name: str, description: str = "") -> Project:
+    return Project(
+        id=1,
+        name=name,
+        description=description,
+        price_limit=1000,
+        possible_price_limit=3000,
+        profile_url="",
+        active_wants=0,
+        time_left="",
+        kwork_count=0,
+        wants_count=0,
+        wants_hired_percent=0
+    )
+
+
+class WholeWordTest(unittest.TestCase):
+    def check(self, user_filter: UserFilter, text: str, accepted: bool) -> None:
+        self.assertEqual(user_filter.accepts(project(text)), accepted)
+        self.assertEqual(FilterIndex({1: user_filter}).rejected(project(text)) == set(), accepted)
+
+    def test_keyword_inside_longer_word(self) -> None:
+        user_filter = UserFilter(keywords=("бот",))
+        self.check(user_filter, "Нужна работа по верстке", False)
+        self.check(user_filter, "Нужен бот для Telegram", True)
+        self.check(user_filter, "Telegram-бот, срочно", True)
+
+    def test_negative_keyword_inside_longer_word(self) -> None:
+        user_filter = UserFilter(negative_keywords=("ии",))
+        self.check(user_filter, "Настройка интеграции с CRM", True)
+        self.check(user_filter, "Заполнить карточки категории", True)
+        self.check(user_filter, "Сайт с ИИ-ассистентом", False)
+
+    def test_phrase_keyword(self) -> None:
+        user_filter = UserFilter(keywords=("telegram бот",))
+        self.check(user_filter, "Нужен Telegram бот", True)
+        self.check(user_filter, "Нужен Telegram ботаник", False)
+
+    def test_pure_python_automaton(self) -> None:
+        automaton = Automaton(["бот", "ии", "работа"])
+        self.assertEqual(automaton.search("работа с ии, не интеграции"), {1, 2})
+
+    @unittest.skipIf(filters.ahocorasick is None, "pyahocorasick is not installed")
+    def test_native_automaton(self) -> None:
+        automaton = filters.NativeAutomaton(["бот", "ии", "работа"])
+        self.assertEqual(automaton.search("работа с ии, не интеграции"), {1, 2})
+
+
+if __name__ == "__main__":
+    unittest.main()